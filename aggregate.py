@@ -0,0 +1,215 @@
+from array import array
+
+import columnar
+import indexes
+import packed
+import profiler
+
+# NumPy необязателен: без него итоги считаются обычным циклом. Он загружается
+# при первом подсчёте итогов (load_numpy), а не при запуске программы
+np = None
+numpy_checked = False
+
+# Итоги по группам: count (число записей в группе, а если задано числовое
+# поле — число заполненных значений), sum, avg, min, max по полю int или float.
+# Столбцы базы переводятся в массивы NumPy один раз и хранятся в db.cache до
+# первого изменения, поэтому повторные запросы идут только по массивам
+FUNCTIONS = ["count", "sum", "avg", "min", "max"]
+
+
+def check_fields(fields, value_field, group_field):
+    types = {field["name"]: field["type"] for field in fields}
+    for name in (value_field, group_field):
+        if name is not None and name not in types:
+            raise ValueError(f"Поле '{name}' отсутствует в базе данных!")
+    if value_field is not None and types[value_field] not in ("int", "float"):
+        raise ValueError(f"Сумму и среднее можно считать только по полям int и float: {value_field}")
+
+
+def load_numpy():
+    global np, numpy_checked
+    if not numpy_checked:
+        numpy_checked = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+    return np
+
+
+# Маска живых строк (удалённые строки — None)
+def alive_mask(db):
+    if "alive" not in db.cache:
+        db.cache["alive"] = np.array(packed.alive(db.rows), dtype=bool)
+    return db.cache["alive"]
+
+
+# Числовой столбец: значения и маска заполненных (числовых) значений.
+# Столбец-массив таблицы (packed.Table) берётся целиком, без перебора значений
+def column_array(db, field):
+    key = ("column", field)
+    if key not in db.cache:
+        dtype = np.int64 if db.field_type(field) == "int" else np.float64
+        raw = packed.column(db.rows, field)
+        if isinstance(raw, array):
+            values = np.frombuffer(raw, dtype=np.int64 if raw.typecode == "q" else np.float64).astype(dtype)
+            valid = np.ones(len(raw), dtype=bool)
+        else:
+            valid = np.fromiter((indexes.is_number(value) for value in raw), dtype=bool, count=len(raw))
+            numbers = [value if ok else 0 for value, ok in zip(raw, valid)]
+            try:
+                values = np.array(numbers, dtype=dtype)
+            except OverflowError:
+                values = np.array(numbers, dtype=np.float64)  # Числа вне диапазона int64
+        db.cache[key] = (values, valid)
+    return db.cache[key]
+
+
+# Коды групп: номер строки -> номер значения поля группировки, и сами значения
+def group_codes(db, field):
+    key = ("codes", field)
+    if key not in db.cache:
+        labels = {}
+        codes = np.fromiter(
+            (labels.setdefault(value, len(labels)) for value in packed.column(db.rows, field)),
+            dtype=np.int64, count=len(db.rows),
+        )
+        db.cache[key] = (codes, list(labels))
+    return db.cache[key]
+
+
+def group_sort_key(result):
+    label = result["group"]
+    return label is None, isinstance(label, str), label if label is not None else 0
+
+
+# Итоги по группам с NumPy: bincount для количества, ufunc.at для суммы, минимума и максимума
+def aggregate_numpy(db, value_field, group_field):
+    alive = alive_mask(db)
+    if group_field is None:
+        codes, labels = np.zeros(len(db.rows), dtype=np.int64), [None]
+    else:
+        codes, labels = group_codes(db, group_field)
+    groups = len(labels)
+
+    sizes = np.bincount(codes[alive], minlength=groups)
+    results = []
+    if value_field is None:
+        for code in np.flatnonzero(sizes):
+            results.append({"group": labels[code], "count": int(sizes[code])})
+        return results
+
+    values, valid = column_array(db, value_field)
+    mask = alive & valid
+    group_of, picked = codes[mask], values[mask]
+    counts = np.bincount(group_of, minlength=groups)
+    sums = np.zeros(groups, dtype=values.dtype)
+    np.add.at(sums, group_of, picked)
+    if values.dtype.kind == "i":
+        info = np.iinfo(values.dtype)
+        mins, maxs = np.full(groups, info.max, dtype=values.dtype), np.full(groups, info.min, dtype=values.dtype)
+    else:
+        mins, maxs = np.full(groups, np.inf), np.full(groups, -np.inf)
+    np.minimum.at(mins, group_of, picked)
+    np.maximum.at(maxs, group_of, picked)
+
+    for code in np.flatnonzero(sizes):
+        count = int(counts[code])
+        result = {"group": labels[code], "count": count, "sum": sums[code].item()}
+        result["avg"] = result["sum"] / count if count else None
+        result["min"] = mins[code].item() if count else None
+        result["max"] = maxs[code].item() if count else None
+        results.append(result)
+    return results
+
+
+# Накопление итогов по записям в totals (группа -> итоги). Частичные итоги
+# (например, по секциям базы) складываются через merge_totals
+def accumulate(totals, records, value_field, group_field):
+    records = [record for record in records if record is not None]
+    labels = [None if group_field is None else record.get(group_field) for record in records]
+    values = None if value_field is None else [record.get(value_field) for record in records]
+    return accumulate_values(totals, labels, values)
+
+
+# То же по готовым столбцам: группы и значения (values None — только количество)
+def accumulate_values(totals, labels, values):
+    for position, label in enumerate(labels):
+        total = totals.get(label)
+        if total is None:
+            total = totals[label] = {"group": label, "count": 0}
+            if values is not None:
+                total.update({"sum": 0, "min": None, "max": None})
+        if values is None:
+            total["count"] += 1
+            continue
+        value = values[position]
+        if not indexes.is_number(value):
+            continue
+        total["count"] += 1
+        total["sum"] += value
+        total["min"] = value if total["min"] is None else min(total["min"], value)
+        total["max"] = value if total["max"] is None else max(total["max"], value)
+    return totals
+
+
+def merge_totals(totals, other):
+    for label, part in other.items():
+        total = totals.get(label)
+        if total is None:
+            totals[label] = part
+            continue
+        total["count"] += part["count"]
+        if "sum" in part:
+            total["sum"] += part["sum"]
+            for name, pick in (("min", min), ("max", max)):
+                if part[name] is not None:
+                    total[name] = part[name] if total[name] is None else pick(total[name], part[name])
+    return totals
+
+
+# Итоги списком, со средним значением
+def totals_list(totals, value_field):
+    results = list(totals.values())
+    if value_field is not None:
+        for total in results:
+            total["avg"] = total["sum"] / total["count"] if total["count"] else None
+    return results
+
+
+# То же обычным циклом (если NumPy не установлен)
+def aggregate_python(db, value_field, group_field):
+    return totals_list(accumulate({}, db.rows, value_field, group_field), value_field)
+
+
+# Итоги по колоночному файлу (.col) без загрузки базы: через mmap читаются только
+# столбцы value_field и group_field. Журнал не учитывается, поэтому вызывать,
+# только когда он пуст
+@profiler.timed("aggregate_columnar")
+def aggregate_columnar(file_path, value_field=None, group_field=None):
+    with columnar.ColumnarFile(file_path) as table:
+        check_fields(table.fields, value_field, group_field)
+        profiler.count("aggregate_columnar", rows_scanned=len(table))
+        if not len(table):
+            return []
+        if group_field is None and value_field is not None:
+            totals = {None: {"group": None, **table.column_stats(value_field)}}
+        else:
+            labels = [None] * len(table) if group_field is None else table.column_values(group_field)
+            values = None if value_field is None else table.column_values(value_field)
+            totals = accumulate_values({}, labels, values)
+    return sorted(totals_list(totals, value_field), key=group_sort_key)
+
+
+# Итоги по полю value_field (None — только количество) с группировкой по
+# group_field (None — одна строка итогов по всей таблице). Группы упорядочены по значению
+@profiler.timed("aggregate")
+def aggregate(db, value_field=None, group_field=None):
+    check_fields(db.fields, value_field, group_field)
+    if load_numpy() is not None:
+        results = aggregate_numpy(db, value_field, group_field)
+    else:
+        results = aggregate_python(db, value_field, group_field)
+    profiler.count("aggregate", rows_scanned=db.count(), rows_returned=len(results))
+    return sorted(results, key=group_sort_key)
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import lzma
+import os
+import time
+import zlib
+
+import storage
+import partition
+import profiler
+
+# Хранилище резервных копий лежит рядом с базой: <файл>.backups/
+#   chunks/<первые 2 символа хеша>/<sha256>.<метод> — сжатые куски файлов,
+#   snapshots/<номер>.json — описание снимка: списки хешей кусков снимка и журнала.
+# Границы кусков зависят от содержимого, а не от смещения: кусок может
+# закончиться только после перевода строки (в текстовых форматах — на границе
+# записи), и только если CRC32 последних BOUNDARY_WINDOW байт делится на
+# BOUNDARY_MASK + 1. Поэтому вставка или удаление записей (например, при
+# свёртке журнала) меняют лишь куски вокруг изменённого места, а следующие
+# куски совпадают с прежними. Кусок хранится один раз на всё хранилище.
+# Неизменившаяся база не добавляет ни одного куска, а у журнала (он только
+# дописывается) новым оказывается лишь хвост.
+# У секционированной базы в снимок входят и файлы секций ("segment/<имя>")
+BACKUP_SUFFIX = ".backups"
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 1024 * 1024
+BOUNDARY_WINDOW = 64
+BOUNDARY_MASK = 511
+READ_SIZE = 4 * MAX_CHUNK
+COMPRESSION = "zlib"
+COMPRESSORS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "xz": (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+
+
+def backup_dir(file_path):
+    return file_path + BACKUP_SUFFIX
+
+
+def chunk_path(file_path, digest, method):
+    return os.path.join(backup_dir(file_path), "chunks", digest[:2], f"{digest}.{method}")
+
+
+def manifest_path(file_path, number):
+    return os.path.join(backup_dir(file_path), "snapshots", f"{number}.json")
+
+
+# Описания снимков по возрастанию номера
+def list_snapshots(file_path):
+    folder = os.path.join(backup_dir(file_path), "snapshots")
+    if not os.path.isdir(folder):
+        return []
+    numbers = sorted(int(name[:-5]) for name in os.listdir(folder) if name.endswith(".json") and name[:-5].isdigit())
+    return [read_manifest(file_path, number) for number in numbers]
+
+
+def read_manifest(file_path, number):
+    path = manifest_path(file_path, number)
+    if not os.path.exists(path):
+        raise ValueError(f"Резервная копия №{number} не найдена!")
+    with open(path, "r", encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)
+
+
+# Конец куска, начинающегося с start: первая граница по содержимому не ближе
+# MIN_CHUNK, иначе MAX_CHUNK. None — в data пока не хватает байт, чтобы решить
+def chunk_end(data, start):
+    limit = min(len(data), start + MAX_CHUNK)
+    position = data.find(b"\n", start + MIN_CHUNK - 1, limit)
+    while position >= 0:
+        position += 1
+        if not zlib.crc32(data[position - BOUNDARY_WINDOW:position]) & BOUNDARY_MASK:
+            return position
+        position = data.find(b"\n", position, limit)
+    if len(data) >= start + MAX_CHUNK:
+        return start + MAX_CHUNK
+    return None
+
+
+# Куски файла по границам chunk_end; последний — остаток файла
+def split_chunks(source):
+    pending = b""
+    while True:
+        data = source.read(READ_SIZE)
+        pending += data
+        start = 0
+        end = chunk_end(pending, start)
+        while end is not None:
+            yield pending[start:end]
+            start = end
+            end = chunk_end(pending, start)
+        pending = pending[start:]
+        if not data:
+            if pending:
+                yield pending
+            return
+
+
+# Сохранение файла кусками; возвращает хеши кусков и число байт, записанных
+# в хранилище впервые (после сжатия)
+def store_file(file_path, path, method, progress, state):
+    compress = COMPRESSORS[method][0]
+    digests = []
+    stored = 0
+    with open(path, "rb") as source:
+        for data in split_chunks(source):
+            digest = hashlib.sha256(data).hexdigest()
+            digests.append(digest)
+            target = chunk_path(file_path, digest, method)
+            if not os.path.exists(target):
+                packed = compress(data)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                storage.write_atomic(target, lambda temp_path: write_bytes(temp_path, packed))
+                stored += len(packed)
+            state["done"] += len(data)
+            if progress is not None:
+                progress(state["done"], state["total"])
+    return digests, stored
+
+
+def write_bytes(path, data):
+    with open(path, "wb") as target:
+        target.write(data)
+
+
+# Новый снимок базы (снимок и журнал). Описание пишется последним, поэтому
+# прерванное копирование не оставляет неполного снимка.
+# Возвращает описание снимка; в "stored" — сколько байт добавилось в хранилище
+@profiler.timed("backup")
+def create_snapshot(file_path, progress=None, method=COMPRESSION):
+    if method not in COMPRESSORS:
+        raise ValueError(f"Неизвестный метод сжатия: {method}")
+
+    files = {"snapshot": file_path}
+    if os.path.exists(storage.log_path(file_path)):
+        files["log"] = storage.log_path(file_path)
+    if partition.is_partitioned(file_path):
+        for path in partition.segment_paths(file_path):
+            files["segment/" + os.path.basename(path)] = path
+    state = {"done": 0, "total": sum(storage.file_size(path) for path in files.values())}
+
+    snapshots = list_snapshots(file_path)
+    manifest = {
+        "number": snapshots[-1]["number"] + 1 if snapshots else 1,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "method": method,
+        "files": {},
+        "sizes": {},
+        "stored": 0,
+    }
+    for name, path in files.items():
+        digests, stored = store_file(file_path, path, method, progress, state)
+        manifest["files"][name] = digests
+        manifest["sizes"][name] = storage.file_size(path)
+        manifest["stored"] += stored
+    profiler.count("backup", bytes_read=state["total"], bytes_written=manifest["stored"])
+
+    os.makedirs(os.path.dirname(manifest_path(file_path, manifest["number"])), exist_ok=True)
+    text = json.dumps(manifest, ensure_ascii=False, indent=4)
+    storage.write_atomic(manifest_path(file_path, manifest["number"]), lambda temp_path: write_bytes(temp_path, text.encode("utf-8")))
+    return manifest
+
+
+# Сборка файла из кусков с проверкой хешей
+def rebuild_file(file_path, manifest, name, target, progress, state):
+    decompress = COMPRESSORS[manifest["method"]][1]
+    with open(target, "wb") as output:
+        for digest in manifest["files"][name]:
+            path = chunk_path(file_path, digest, manifest["method"])
+            if not os.path.exists(path):
+                raise ValueError(f"В хранилище нет куска {digest[:12]}, копия №{manifest['number']} повреждена!")
+            with open(path, "rb") as chunk_file:
+                data = decompress(chunk_file.read())
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise ValueError(f"Кусок {digest[:12]} повреждён, копия №{manifest['number']} не восстановлена!")
+            output.write(data)
+            state["done"] += len(data)
+            if progress is not None:
+                progress(state["done"], state["total"])
+    storage.sync_file(target)
+
+
+# Файл базы, в который восстанавливается часть снимка name
+def restore_target(file_path, name):
+    if name.startswith("segment/"):
+        return os.path.join(partition.segment_dir(file_path), name[len("segment/"):])
+    return {"snapshot": file_path, "log": storage.log_path(file_path)}[name]
+
+
+# Восстановление базы из снимка с номером number. Файлы собираются во временные
+# и заменяют текущие только после сборки и проверки всех кусков
+@profiler.timed("restore")
+def restore_snapshot(file_path, number, progress=None):
+    manifest = read_manifest(file_path, number)
+    targets = {name: restore_target(file_path, name) for name in manifest["files"]}
+    for target in targets.values():
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    state = {"done": 0, "total": sum(manifest["sizes"].values())}
+
+    try:
+        for name in manifest["files"]:
+            rebuild_file(file_path, manifest, name, targets[name] + ".tmp", progress, state)
+    except BaseException:
+        for name in manifest["files"]:
+            if os.path.exists(targets[name] + ".tmp"):
+                os.remove(targets[name] + ".tmp")
+        raise
+
+    for name in manifest["files"]:
+        os.replace(targets[name] + ".tmp", targets[name])
+    storage.sync_dir(file_path)
+    # Журнал и индекс текущей базы к восстановленному снимку не относятся
+    stale = [storage.index_path(file_path)]
+    if "log" not in manifest["files"]:
+        stale.append(storage.log_path(file_path))
+    for path in stale:
+        if os.path.exists(path):
+            os.remove(path)
+    return manifest
+
+
+# Удаление старых снимков (остаются keep последних) и кусков, на которые они больше не ссылаются.
+# Возвращает число удалённых кусков
+def prune(file_path, keep):
+    snapshots = list_snapshots(file_path)
+    for manifest in snapshots[:max(0, len(snapshots) - keep)]:
+        os.remove(manifest_path(file_path, manifest["number"]))
+
+    used = set()
+    for manifest in list_snapshots(file_path):
+        for digests in manifest["files"].values():
+            used.update(f"{digest}.{manifest['method']}" for digest in digests)
+
+    removed = 0
+    chunks = os.path.join(backup_dir(file_path), "chunks")
+    for folder, _, names in os.walk(chunks):
+        for name in names:
+            if name not in used:
+                os.remove(os.path.join(folder, name))
+                removed += 1
+    return removed
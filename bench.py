@@ -0,0 +1,200 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import storage
+import database
+import query
+import datagen
+
+# Замеры производительности без графического интерфейса. Для каждого размера
+# базы и формата файла генерируется база (datagen) и замеряются операции:
+#   generate, open_cold (первое открытие, строится .idx), open_warm,
+#   insert (по одной записи), insert_batch (групповая запись), lookup (по ключу),
+#   range_indexed (between по сортированному индексу), range_scan (перебор),
+#   query (запрос с AND по двум индексам), page (страницы просмотрщика),
+#   delete_by_field, save (полная перезапись), import (CSV, если есть pandas).
+# Отдельно замеряется память, занятая открытой базой (строки и индексы).
+# Отчёт пишется в JSON; --compare сравнивает его с отчётом прошлой версии.
+DEFAULT_SIZES = [10000, 100000]
+DEFAULT_FORMATS = [".json"]
+INSERT_OPS = 1000
+LOOKUP_OPS = 10000
+RANGE_OPS = 20
+PAGE_OPS = 1000
+PAGE_ROWS = 20
+
+
+def timed(metrics, name, function, ops=1):
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    metrics[name] = {"seconds": round(seconds, 6), "ops": ops, "per_op_us": round(seconds / ops * 1e6, 3)}
+    return result
+
+
+def new_record(i):
+    return {"id": i, "name": f"new{i}", "age": i % 90, "city": "Тула", "score": 50.0}
+
+
+# Замеры для одной базы размера size в формате extension
+def run_case(folder, size, extension, seed=0):
+    rng = random.Random(seed)
+    file_path = os.path.join(folder, f"bench-{size}{extension}")
+    metrics = {}
+
+    timed(metrics, "generate", lambda: datagen.generate(file_path, size, seed=seed), size)
+    db = timed(metrics, "open_cold", lambda: database.Database(file_path))
+    db = timed(metrics, "open_warm", lambda: database.Database(file_path))
+
+    timed(metrics, "insert", lambda: [db.add(new_record(size + i)) for i in range(INSERT_OPS)], INSERT_OPS)
+
+    def insert_batch():
+        with db.batch():
+            for i in range(INSERT_OPS):
+                db.add(new_record(size + INSERT_OPS + i))
+    timed(metrics, "insert_batch", insert_batch, INSERT_OPS)
+
+    keys = [(rng.randrange(size),) for _ in range(LOOKUP_OPS)]
+    timed(metrics, "lookup", lambda: [db.find(key) for key in keys], LOOKUP_OPS)
+
+    bounds = [rng.randint(0, 85) for _ in range(RANGE_OPS)]
+    timed(metrics, "range_indexed", lambda: [db.search("age", "between", low, low + 2) for low in bounds], RANGE_OPS)
+    timed(metrics, "range_scan", lambda: [db.search("score", "between", low, low + 2.0) for low in bounds], RANGE_OPS)
+    timed(metrics, "query", lambda: [query.execute(db, f"age = {low} AND city = Тула") for low in bounds], RANGE_OPS)
+
+    offsets = [rng.randrange(max(1, db.count() - PAGE_ROWS)) for _ in range(PAGE_OPS)]
+    timed(metrics, "page", lambda: [db.page(offset, PAGE_ROWS) for offset in offsets], PAGE_OPS)
+
+    timed(metrics, "delete_by_field", lambda: db.delete_rows(db.indices.search(db.rows, "age", "=", 42)))
+    timed(metrics, "save", lambda: db.rewrite(db.records()), db.count())
+
+    metrics.update(run_import(folder, file_path, extension))
+    return {
+        "size": size,
+        "format": extension,
+        "file_bytes": storage.file_size(file_path),
+        "memory_bytes": measure_memory(file_path),
+        "metrics": metrics,
+    }
+
+
+# Память, которую занимает открытая база (по tracemalloc, поэтому отдельно от замеров времени)
+def measure_memory(file_path):
+    tracemalloc.start()
+    try:
+        db = database.Database(file_path)
+        used = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del db
+    return used
+
+
+# Импорт CSV того же размера; без pandas замер пропускается
+def run_import(folder, file_path, extension):
+    try:
+        import importer
+    except ImportError as e:
+        return {"import": {"skipped": str(e)}}
+
+    csv_path = os.path.join(folder, "bench.csv")
+    fields, _ = storage.read_header(file_path)
+    names = [field["name"] for field in fields]
+    with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(names)
+        rows = 0
+        for record in storage.iter_records(file_path):
+            writer.writerow([record[name] for name in names])
+            rows += 1
+
+    metrics = {}
+    target = os.path.join(folder, "imported" + extension)
+    timed(metrics, "import", lambda: importer.import_new(csv_path, target, ["id"]), rows)
+    return metrics
+
+
+def run(sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS, folder=None, seed=0, progress=None):
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "sync_writes": storage.SYNC_WRITES,
+        "results": [],
+    }
+    work_folder = folder or tempfile.mkdtemp(prefix="db-bench-")
+    try:
+        for size in sizes:
+            for extension in formats:
+                if progress is not None:
+                    progress(f"{size} записей, {extension}")
+                report["results"].append(run_case(work_folder, size, extension, seed))
+    finally:
+        if folder is None:
+            shutil.rmtree(work_folder, ignore_errors=True)
+    return report
+
+
+# Сравнение с прошлым отчётом: отношение времени и памяти (больше 1 — стало хуже)
+def compare(report, baseline):
+    old = {(case["size"], case["format"]): case for case in baseline["results"]}
+    lines = []
+    for case in report["results"]:
+        previous_case = old.get((case["size"], case["format"]))
+        if previous_case is None:
+            continue
+        previous = previous_case["metrics"]
+        before = previous_case.get("memory_bytes")
+        if before:
+            ratio = case["memory_bytes"] / before
+            lines.append(f"{case['size']:>9} {case['format']:<6} {'memory':<16} {before / 2 ** 20:10.1f} -> {case['memory_bytes'] / 2 ** 20:10.1f} x{ratio:.2f}")
+        for name, metric in case["metrics"].items():
+            before = previous.get(name, {}).get("seconds")
+            if before and "seconds" in metric:
+                ratio = metric["seconds"] / before
+                mark = "  <-- медленнее" if ratio > 1.2 else ""
+                lines.append(f"{case['size']:>9} {case['format']:<6} {name:<16} {before:10.4f} -> {metric['seconds']:10.4f} x{ratio:.2f}{mark}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности базы данных")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="размеры баз через запятую")
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS), help="форматы через запятую: .json,.jsonl,.col,.parts,.blk")
+    parser.add_argument("--output", default="bench-report.json", help="файл отчёта")
+    parser.add_argument("--compare", help="отчёт прошлой версии для сравнения")
+    parser.add_argument("--dir", help="каталог для файлов баз (по умолчанию временный)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    formats = [extension if extension.startswith(".") else "." + extension for extension in args.formats.split(",")]
+    report = run(sizes, formats, args.dir, args.seed, progress=lambda text: print(f"Замер: {text}", file=sys.stderr))
+
+    with open(args.output, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=4, ensure_ascii=False)
+    for case in report["results"]:
+        print(f"{case['size']} записей, {case['format']}, память {case['memory_bytes'] / 2 ** 20:.1f} МБ:")
+        for name, metric in case["metrics"].items():
+            if "seconds" in metric:
+                print(f"  {name:<16} {metric['seconds']:10.4f} с  ({metric['per_op_us']} мкс/оп)")
+            else:
+                print(f"  {name:<16} пропущено: {metric['skipped']}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            print("\n".join(compare(report, json.load(baseline_file))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
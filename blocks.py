@@ -0,0 +1,211 @@
+import hashlib
+import json
+import lzma
+import os
+import struct
+import zlib
+from bisect import bisect_right
+from contextlib import nullcontext
+from itertools import accumulate
+
+import packed
+import profiler
+import storage
+
+# Сжатый блочный формат (.blk):
+#   сигнатура MAGIC, сжатые блоки записей, каталог блоков (JSON),
+#   смещение каталога (uint64, little-endian) в последних 8 байтах.
+# Блок — записи JSON Lines подряд, сжатые целиком (zlib или xz). В каталоге для
+# каждого блока: [смещение, длина, число записей, хеш несжатого содержимого,
+# наименьший и наибольший ключ] (границы ключей — null, если ключи несравнимы).
+# Чтение одной записи распаковывает только её блок: блок находится по границам
+# ключей, а если под них подходит много блоков — по номеру строки из первичного
+# индекса (.idx) и числу записей в блоках.
+# Границы блоков выбираются по содержимому записей (в среднем BLOCK_ROWS записей,
+# не больше MAX_BLOCK_ROWS): удаление или правка записи меняет только её блок, а не
+# сдвигает все следующие. При перезаписи файла блоки с тем же хешем копируются из
+# прежней версии без повторного сжатия, сжимаются только изменившиеся
+EXTENSION = ".blk"
+MAGIC = b"LRBLK1\n"
+BLOCK_ROWS = 256
+MAX_BLOCK_ROWS = 4 * BLOCK_ROWS
+COMPRESSION = "zlib"
+COMPRESSORS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "xz": (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+# Если границы ключей оставляют больше блоков, запись ищется через файл индекса
+MAX_CANDIDATES = 4
+# Результат lookup для ключа, которого нет в журнале
+NOT_IN_LOG = object()
+
+
+def is_blocks(file_path):
+    return file_path.lower().endswith(EXTENSION)
+
+
+def read_directory_from(db_file):
+    if db_file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Файл не является сжатой блочной базой!")
+    db_file.seek(-8, os.SEEK_END)
+    end = db_file.tell()
+    (offset,) = struct.unpack("<Q", db_file.read(8))
+    db_file.seek(offset)
+    return json.loads(db_file.read(end - offset).decode("utf-8"))
+
+
+def read_directory(file_path):
+    with open(file_path, "rb") as db_file:
+        return read_directory_from(db_file)
+
+
+def read_header(file_path):
+    directory = read_directory(file_path)
+    return directory.get("fields", []), directory.get("key_fields", [])
+
+
+def read_block(db_file, directory, number):
+    offset, length = directory["blocks"][number][:2]
+    db_file.seek(offset)
+    return COMPRESSORS[directory["method"]][1](db_file.read(length))
+
+
+def block_records(text):
+    return [json.loads(line) for line in text.decode("utf-8").splitlines() if line]
+
+
+# Записи по одной; в памяти держится один распакованный блок
+def iter_blocks(file_path):
+    with open(file_path, "rb") as db_file:
+        directory = read_directory_from(db_file)
+        for number in range(len(directory["blocks"])):
+            yield from block_records(read_block(db_file, directory, number))
+
+
+def read_blocks(file_path):
+    fields, key_fields = read_header(file_path)
+    return fields, list(iter_blocks(file_path)), key_fields
+
+
+# Пары (строка JSON Lines в байтах, ключ записи), разбитые на блоки по содержимому строк
+def cut_blocks(lines):
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= MAX_BLOCK_ROWS or zlib.crc32(line[0]) % BLOCK_ROWS == 0:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+# Наименьший и наибольший ключ блока (None, None — без ключей или если ключи несравнимы)
+def key_range(keys):
+    try:
+        return list(min(keys)), list(max(keys))
+    except (TypeError, ValueError):
+        return None, None
+
+
+# Запись базы. Метод сжатия сохраняется от прежней версии файла (для новой — COMPRESSION)
+def write_blocks(file_path, fields, data, key_fields=None):
+    target = storage.final_path(file_path)
+    previous = read_directory(target) if os.path.exists(target) else None
+    method = previous["method"] if previous is not None else COMPRESSION
+    compress = COMPRESSORS[method][0]
+    # Прежние блоки читаются из целевого файла, поэтому только при записи через временный
+    reuse = {}
+    if previous is not None and os.path.abspath(target) != os.path.abspath(file_path):
+        reuse = {block[3]: block[:2] for block in previous["blocks"]}
+
+    lines = (
+        (json.dumps(packed.unpack(record), ensure_ascii=False).encode("utf-8") + b"\n", storage.record_key(record, key_fields or []))
+        for record in data
+    )
+    directory = {"format": "blocks", "fields": fields, "method": method, "rows": 0, "blocks": []}
+    if key_fields is not None:
+        directory["key_fields"] = key_fields
+    compressed_bytes = 0
+    with open(file_path, "wb") as db_file, (open(target, "rb") if reuse else nullcontext()) as old_file:
+        db_file.write(MAGIC)
+        position = len(MAGIC)
+        for block in cut_blocks(lines):
+            text = b"".join(line for line, _ in block)
+            digest = hashlib.sha256(text).hexdigest()[:16]
+            if digest in reuse:
+                old_file.seek(reuse[digest][0])
+                data_bytes = old_file.read(reuse[digest][1])
+            else:
+                data_bytes = compress(text)
+                compressed_bytes += len(data_bytes)
+            db_file.write(data_bytes)
+            lowest, highest = key_range([key for _, key in block]) if key_fields else (None, None)
+            directory["blocks"].append([position, len(data_bytes), len(block), digest, lowest, highest])
+            directory["rows"] += len(block)
+            position += len(data_bytes)
+        db_file.write(json.dumps(directory, ensure_ascii=False).encode("utf-8"))
+        db_file.write(struct.pack("<Q", position))
+    profiler.count("block_compress", bytes_written=compressed_bytes)
+
+
+# Состояние записи с ключом key по журналу: запись, None (удалена) или NOT_IN_LOG
+def log_record(entries, key_fields, key):
+    found = NOT_IN_LOG
+    for entry in entries:
+        if entry["op"] in ("edit", "delete") and tuple(entry["key"]) == key:
+            found = None
+        if entry["op"] in ("add", "edit") and storage.record_key(entry["record"], key_fields) == key:
+            found = entry["record"]
+    return found
+
+
+# Запись снимка с номером row: распаковывается только блок, в котором она лежит
+def read_row(db_file, directory, row):
+    starts = list(accumulate((block[2] for block in directory["blocks"]), initial=0))
+    number = bisect_right(starts, row) - 1
+    profiler.count("block_lookup", bytes_read=directory["blocks"][number][1])
+    return block_records(read_block(db_file, directory, number))[row - starts[number]]
+
+
+# Блоки, в которые по границам ключей может попасть key
+def candidate_blocks(directory, key):
+    key = list(key)
+    numbers = []
+    for number, block in enumerate(directory["blocks"]):
+        try:
+            if block[4] is None or block[4] <= key <= block[5]:
+                numbers.append(number)
+        except TypeError:
+            numbers.append(number)
+    return numbers
+
+
+# Запись по составному ключу без загрузки базы (None, если её нет).
+# Журнал накладывается поверх снимка. Распаковываются только блоки, в границы
+# ключей которых попадает key; если таких много, а файл индекса действителен,
+# номер строки берётся из него
+@profiler.timed("block_lookup")
+def lookup(file_path, key):
+    key = tuple(key)
+    _, key_fields = read_header(file_path)
+    if not key_fields:
+        raise ValueError("Ключевые поля не указаны!")
+    found = log_record(storage.read_log(file_path), key_fields, key)
+    if found is not NOT_IN_LOG:
+        return found
+
+    with open(file_path, "rb") as db_file:
+        directory = read_directory_from(db_file)
+        candidates = candidate_blocks(directory, key)
+        if len(candidates) > MAX_CANDIDATES and storage.index_current(file_path):
+            row = storage.load_index(file_path)[0].get(key)
+            if row is None or row >= directory["rows"]:
+                return None
+            return read_row(db_file, directory, row)
+
+        for number in candidates:
+            profiler.count("block_lookup", bytes_read=directory["blocks"][number][1], scans=1)
+            for record in block_records(read_block(db_file, directory, number)):
+                if storage.record_key(record, key_fields) == key:
+                    return record
+    return None
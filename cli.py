@@ -0,0 +1,317 @@
+import argparse
+import json
+import sys
+
+import storage
+import indexes
+import database
+import query
+import backup
+import profiler
+import aggregate
+import partition
+import partscan
+import columnar
+import blocks
+import export as exporter
+import history
+
+# Пакетная работа с базой из командной строки, без графического интерфейса:
+#   python cli.py insert база.json записи.jsonl
+#   python cli.py delete база.json возраст "<" 18
+#   python cli.py search база.json возраст between 18 30
+#   python cli.py get база.blk 17 Иванов
+#   python cli.py query база.json "SELECT имя WHERE возраст >= 18 AND город = Тула LIMIT 10" --explain
+#   python cli.py aggregate база.json --by город --field возраст
+#   python cli.py count база.parts "возраст > 30"
+#   python cli.py export база.json база.jsonl
+#   python cli.py dump база.json выгрузка.csv --query "SELECT имя, город WHERE возраст >= 18"
+#   python cli.py compact база.json
+#   python cli.py --history delete база.json город = Тула
+#   python cli.py undo база.json
+#   python cli.py backup база.json --keep 24
+#   python cli.py restore база.json 3
+# Для секционированной базы (.parts) query, count и aggregate не загружают её целиком,
+# а просматривают секции параллельно в нескольких процессах. Для колоночной (.col)
+# без журнала count и aggregate читают только нужные столбцы.
+# Для сжатой блочной базы (.blk) get распаковывает только блок с нужной записью
+
+
+# Записи для вставки: JSON Lines (по записи на строку) или JSON-массив; "-" — стандартный ввод
+def read_records(path):
+    source = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        text = source.read()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+# Значения условия, приведённые к типу поля
+def condition(db, args):
+    field_type = db.field_type(args.field)
+    value = storage.convert_value(field_type, args.value)
+    upper = None
+    if args.op == "between":
+        if args.upper is None:
+            raise ValueError("Для between нужна верхняя граница!")
+        upper = storage.convert_value(field_type, args.upper)
+    return args.field, args.op, value, upper
+
+
+def insert(args):
+    db = database.Database(args.db)
+    records = read_records(args.records)
+    names = {field["name"] for field in db.fields}
+    for record in records:
+        unknown = set(record) - names
+        if unknown:
+            raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+
+    # Ключи проверяются до записи первой пачки, чтобы ошибка не оставила базу наполовину заполненной
+    if db.key_fields:
+        keys = set()
+        for record in records:
+            key = db.key_of(record)
+            if key in db.primary_index or key in keys:
+                raise ValueError(f"Запись с ключом {key} уже существует!")
+            keys.add(key)
+
+    # Пачки применяются в памяти, а на диск всё уходит одной групповой записью с одним fsync
+    with db.batch():
+        for start in range(0, len(records), args.batch):
+            db.add_many(records[start:start + args.batch])
+    print(f"Добавлено записей: {len(records)}")
+
+
+def delete(args):
+    db = database.Database(args.db)
+    rows = db.indices.search(db.rows, *condition(db, args))
+    if rows:
+        db.delete_rows(rows)
+    print(f"Удалено записей: {len(rows)}")
+
+
+def search(args):
+    db = database.Database(args.db)
+    found = db.search(*condition(db, args))
+    if args.limit is not None:
+        found = found[:args.limit]
+    for record in found:
+        print(json.dumps(dict(record), ensure_ascii=False))
+
+
+# Запись по значениям ключевых полей (в порядке key_fields)
+def get(args):
+    fields, key_fields = storage.read_header(args.db)
+    if len(args.key) != len(key_fields):
+        raise ValueError(f"Нужны значения ключевых полей: {', '.join(key_fields)}")
+    types = {field["name"]: field["type"] for field in fields}
+    key = [storage.convert_value(types.get(name, "str"), value) for name, value in zip(key_fields, args.key)]
+    if blocks.is_blocks(args.db):
+        record = blocks.lookup(args.db, key)
+    else:
+        record = database.Database(args.db).find(key)
+    if record is None:
+        raise ValueError(f"Запись с ключом {tuple(key)} не найдена.")
+    print(json.dumps(dict(record), ensure_ascii=False))
+
+
+def run_query(args):
+    if partition.is_partitioned(args.db) and not args.explain:
+        _, found = partscan.parallel_query(args.db, args.text)
+    else:
+        db = database.Database(args.db)
+        if args.explain:
+            print(query.explain(db, args.text))
+            return
+        _, found, _ = query.execute(db, args.text)
+    for record in found:
+        print(json.dumps(dict(record), ensure_ascii=False))
+
+
+# Колоночный файл, в котором нет неприменённых изменений: его столбцы можно читать напрямую
+def columns_only(file_path):
+    return columnar.is_columnar(file_path) and storage.file_size(storage.log_path(file_path)) == 0
+
+
+def count(args):
+    if partition.is_partitioned(args.db):
+        print(partscan.parallel_count(args.db, args.text))
+        return
+    if columns_only(args.db) and not args.text:
+        with columnar.ColumnarFile(args.db) as table:
+            print(len(table))
+        return
+    db = database.Database(args.db)
+    print(len(query.execute(db, args.text)[1]) if args.text else db.count())
+
+
+def run_aggregate(args):
+    if partition.is_partitioned(args.db):
+        results = partscan.parallel_aggregate(args.db, args.field, args.by)
+    elif columns_only(args.db):
+        results = aggregate.aggregate_columnar(args.db, args.field, args.by)
+    else:
+        results = aggregate.aggregate(database.Database(args.db), args.field, args.by)
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+
+
+def export(args):
+    storage.convert(args.db, args.target)
+    print(f"База сохранена в {args.target}")
+
+
+def dump(args):
+    written = exporter.export(database.Database(args.db), args.target, args.query)
+    print(f"Выгружено записей: {written}")
+
+
+# Отмена и повтор работают по истории, сохранённой в <файл>.history (ключ --history)
+def undo(args):
+    history.PERSIST = True
+    database.Database(args.db).undo()
+    print("Последнее изменение отменено")
+
+
+def redo(args):
+    history.PERSIST = True
+    database.Database(args.db).redo()
+    print("Отменённое изменение повторено")
+
+
+def compact(args):
+    storage.compact(args.db)
+    print("Журнал изменений свёрнут")
+
+
+def create_backup(args):
+    manifest = backup.create_snapshot(args.db, method=args.method)
+    print(f"Создана резервная копия №{manifest['number']}, добавлено в хранилище: {manifest['stored']} байт")
+    if args.keep is not None:
+        removed = backup.prune(args.db, args.keep)
+        print(f"Удалено неиспользуемых кусков: {removed}")
+
+
+def restore(args):
+    if args.number is None:
+        for manifest in backup.list_snapshots(args.db):
+            print(f"№{manifest['number']}  {manifest['created']}  {sum(manifest['sizes'].values())} байт")
+        return
+    backup.restore_snapshot(args.db, args.number)
+    print(f"База восстановлена из копии №{args.number}")
+
+
+def add_condition_arguments(parser):
+    parser.add_argument("field", help="поле")
+    parser.add_argument("op", choices=indexes.OPERATORS, help="операция сравнения")
+    parser.add_argument("value", help="значение")
+    parser.add_argument("upper", nargs="?", help="верхняя граница для between")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Пакетная работа с базой данных")
+    parser.add_argument("--profile", help="сохранить счётчики операций и отчёт cProfile в JSON-файл")
+    parser.add_argument("--history", action="store_true", help="сохранять историю изменений для undo и redo")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("insert", help="добавить записи из файла JSON Lines или JSON")
+    command.add_argument("db", help="файл базы")
+    command.add_argument("records", help="файл с записями ('-' — стандартный ввод)")
+    command.add_argument("--batch", type=int, default=10000, help="записей в одной пачке")
+    command.set_defaults(handler=insert)
+
+    command = commands.add_parser("delete", help="удалить записи по значению поля")
+    command.add_argument("db", help="файл базы")
+    add_condition_arguments(command)
+    command.set_defaults(handler=delete)
+
+    command = commands.add_parser("search", help="найти записи по значению поля")
+    command.add_argument("db", help="файл базы")
+    add_condition_arguments(command)
+    command.add_argument("--limit", type=int, help="не больше N записей")
+    command.set_defaults(handler=search)
+
+    command = commands.add_parser("get", help="найти запись по значениям ключевых полей")
+    command.add_argument("db", help="файл базы")
+    command.add_argument("key", nargs="+", help="значения ключевых полей")
+    command.set_defaults(handler=get)
+
+    command = commands.add_parser("query", help="выполнить запрос (SELECT ... WHERE ... LIMIT ...)")
+    command.add_argument("db", help="файл базы")
+    command.add_argument("text", help="текст запроса")
+    command.add_argument("--explain", action="store_true", help="только показать план выполнения")
+    command.set_defaults(handler=run_query)
+
+    command = commands.add_parser("count", help="число записей (всех или подходящих под условие)")
+    command.add_argument("db", help="файл базы")
+    command.add_argument("text", nargs="?", help="условие на языке запросов")
+    command.set_defaults(handler=count)
+
+    command = commands.add_parser("aggregate", help="итоги count/sum/avg/min/max по группам")
+    command.add_argument("db", help="файл базы")
+    command.add_argument("--by", help="поле группировки")
+    command.add_argument("--field", help="числовое поле для sum/avg/min/max")
+    command.set_defaults(handler=run_aggregate)
+
+    command = commands.add_parser("export", help="сохранить базу в другом формате (по расширению)")
+    command.add_argument("db", help="файл базы")
+    command.add_argument("target", help="новый файл .json, .jsonl, .col, .parts или .blk")
+    command.set_defaults(handler=export)
+
+    command = commands.add_parser("dump", help="выгрузить записи в CSV, Excel или JSON Lines")
+    command.add_argument("db", help="файл базы")
+    command.add_argument("target", help="файл .csv, .xlsx или .jsonl (записи без заголовка базы)")
+    command.add_argument("--query", help="запрос или условие: какие записи и поля выгрузить")
+    command.set_defaults(handler=dump)
+
+    command = commands.add_parser("undo", help="отменить последнее изменение (записанное с --history)")
+    command.add_argument("db", help="файл базы")
+    command.set_defaults(handler=undo)
+
+    command = commands.add_parser("redo", help="повторить отменённое изменение")
+    command.add_argument("db", help="файл базы")
+    command.set_defaults(handler=redo)
+
+    command = commands.add_parser("compact", help="свернуть журнал изменений в снимок")
+    command.add_argument("db", help="файл базы")
+    command.set_defaults(handler=compact)
+
+    command = commands.add_parser("backup", help="создать резервную копию (сохраняются только изменения)")
+    command.add_argument("db", help="файл базы")
+    command.add_argument("--method", choices=sorted(backup.COMPRESSORS), default=backup.COMPRESSION, help="метод сжатия")
+    command.add_argument("--keep", type=int, help="оставить только N последних копий")
+    command.set_defaults(handler=create_backup)
+
+    command = commands.add_parser("restore", help="восстановить базу из резервной копии (без номера — список копий)")
+    command.add_argument("db", help="файл базы")
+    command.add_argument("number", type=int, nargs="?", help="номер копии")
+    command.set_defaults(handler=restore)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.history:
+        history.PERSIST = True
+    if args.profile:
+        profiler.capture_next()
+    try:
+        # Вся команда — одна операция верхнего уровня, её и профилирует cProfile
+        profiler.timed(f"cli {args.command}")(args.handler)(args)
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.profile:
+            profiler.export(args.profile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+# Колоночный двоичный формат:
+#   сигнатура MAGIC, длина заголовка (uint32, little-endian), заголовок JSON,
+#   затем столбцы, каждый с границы 8 байт.
+# Столбцы int и float хранятся массивами фиксированной ширины. Ширина int выбирается
+# по диапазону значений столбца (1, 2, 4 или 8 байт), float — 4 байта, если все
+# значения точно представимы в float32, иначе 8.
+# Строковый столбец хранится одним из трёх способов:
+#   словарь — различные значения (смещения и байты UTF-8) и код значения на строку
+#             (1, 2 или 4 байта), если значения часто повторяются;
+#   строки одной длины в байтах — только байты UTF-8, ширина в заголовке;
+#   иначе — массив смещений (rows + 1 штук, 4 или 8 байт) и байты UTF-8.
+# Выбранные типы массивов записываются в заголовок столбца.
+# Если в столбце есть пустые значения (None), рядом хранится маска по байту на строку.
+# Файл открывается через mmap, поэтому чтение одного столбца затрагивает только его байты
+EXTENSION = ".col"
+MAGIC = b"LRCOL2\n"
+# Файлы первой версии: числа всегда int64 / float64, смещения uint64
+OLD_MAGIC = b"LRCOL1\n"
+TYPECODES = {"int": "q", "float": "d"}
+INT_TYPECODES = "bhiq"
+UNSIGNED_TYPECODES = "BHIQ"
+# Словарь строится, если различных значений не больше этой доли строк
+DICTIONARY_SHARE = 0.5
+
+
+def is_columnar(file_path):
+    return file_path.lower().endswith(EXTENSION)
+
+
+def column_values(records, field):
+    name, field_type = field["name"], field["type"]
+    values = []
+    for record in records:
+        value = record.get(name)
+        if value is not None:
+            if field_type == "int" and not isinstance(value, int):
+                raise ValueError(f"Значение {value!r} поля '{name}' не является int")
+            if field_type == "float" and not isinstance(value, (int, float)):
+                raise ValueError(f"Значение {value!r} поля '{name}' не является float")
+            if field_type == "str" and not isinstance(value, str):
+                raise ValueError(f"Значение {value!r} поля '{name}' не является str")
+        values.append(value)
+    return values
+
+
+# Самый узкий тип массива, в который помещаются значения от low до high
+def narrow_typecode(typecodes, low, high):
+    for typecode in typecodes:
+        bits = array(typecode).itemsize * 8
+        if typecode.isupper():
+            if high < 1 << bits:
+                return typecode
+        elif -(1 << bits - 1) <= low and high < 1 << bits - 1:
+            return typecode
+    raise ValueError(f"Значение {high if high > 0 else low} не помещается в столбец")
+
+
+def numeric_part(field, values):
+    if field["type"] == "int":
+        values = [0 if value is None else value for value in values]
+        typecode = narrow_typecode(INT_TYPECODES, min(values, default=0), max(values, default=0))
+        return typecode, array(typecode, values)
+    values = [0.0 if value is None else value for value in values]
+    single = array("f", values)
+    if single.tolist() == values:
+        return "f", single
+    return "d", array("d", values)
+
+
+# Байты строк и массив смещений к ним (rows + 1 штук)
+def string_parts(encoded):
+    offsets = [0]
+    position = 0
+    for item in encoded:
+        position += len(item)
+        offsets.append(position)
+    typecode = narrow_typecode(UNSIGNED_TYPECODES, 0, position)
+    return typecode, array(typecode, offsets), b"".join(encoded)
+
+
+# Части столбца: {"data": ...} для чисел, {"bytes": ...} и "offsets" либо "codes"
+# с "dictionary_offsets" для строк, плюс {"nulls": ...}, если есть пустые значения.
+# В info записываются типы массивов и ширина строк
+def pack_column(field, values, info):
+    parts = {}
+    if field["type"] in TYPECODES:
+        info["typecode"], data = numeric_part(field, values)
+        parts["data"] = data.tobytes()
+    else:
+        labels = {}
+        for value in values:
+            labels.setdefault(value, len(labels))
+        if len(labels) <= len(values) * DICTIONARY_SHARE:
+            encoded = [b"" if value is None else value.encode("utf-8") for value in labels]
+            info["codes_typecode"] = narrow_typecode(UNSIGNED_TYPECODES, 0, len(labels) - 1)
+            info["offsets_typecode"], offsets, parts["bytes"] = string_parts(encoded)
+            parts["dictionary_offsets"] = offsets.tobytes()
+            parts["codes"] = array(info["codes_typecode"], map(labels.__getitem__, values)).tobytes()
+        else:
+            encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+            widths = set(map(len, encoded))
+            if len(widths) == 1:
+                info["width"] = widths.pop()
+                parts["bytes"] = b"".join(encoded)
+            else:
+                info["offsets_typecode"], offsets, parts["bytes"] = string_parts(encoded)
+                parts["offsets"] = offsets.tobytes()
+
+    if any(value is None for value in values):
+        parts["nulls"] = bytes(value is None for value in values)
+    return parts
+
+
+def align(position):
+    return (position + 7) // 8 * 8
+
+
+def write_columnar(file_path, fields, data, key_fields=None):
+    data = data if isinstance(data, list) else list(data)
+
+    # Сначала упаковываем столбцы, чтобы знать смещения для заголовка
+    columns = {}
+    layout = []
+    position = 0
+    for field in fields:
+        info = {"type": field["type"]}
+        for name, part in pack_column(field, column_values(data, field), info).items():
+            info[name] = [position, len(part)]
+            layout.append((position, part))
+            position = align(position + len(part))
+        columns[field["name"]] = info
+
+    header = {"fields": fields, "rows": len(data), "columns": columns, "byteorder": sys.byteorder}
+    if key_fields is not None:
+        header["key_fields"] = key_fields
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    base = align(len(MAGIC) + 4 + len(header_bytes))
+
+    with open(file_path, "wb") as db_file:
+        db_file.write(MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        for offset, part in layout:
+            db_file.seek(base + offset)
+            db_file.write(part)
+        db_file.truncate(base + position)
+
+
+def read_header_bytes(db_file):
+    if db_file.read(len(MAGIC)) not in (MAGIC, OLD_MAGIC):
+        raise ValueError("Файл не является колоночной базой данных!")
+    (length,) = struct.unpack("<I", db_file.read(4))
+    header_bytes = db_file.read(length)
+    return json.loads(header_bytes.decode("utf-8")), align(len(MAGIC) + 4 + length)
+
+
+def read_header(file_path):
+    with open(file_path, "rb") as db_file:
+        header, _ = read_header_bytes(db_file)
+    return header.get("fields", []), header.get("key_fields", [])
+
+
+# Строковый столбец: строки декодируются только при обращении.
+# Без смещений все строки одной ширины width байт
+class StringColumn:
+    def __init__(self, offsets, data, width=None, rows=None):
+        self.offsets = offsets
+        self.data = data
+        self.width = width
+        self.rows = len(offsets) - 1 if offsets is not None else rows
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if self.offsets is None:
+            start, end = i * self.width, (i + 1) * self.width
+        else:
+            start, end = self.offsets[i], self.offsets[i + 1]
+        return bytes(self.data[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+# Строковый столбец со словарём: различные значения декодируются один раз при открытии
+class DictionaryColumn:
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def __iter__(self):
+        return map(self.values.__getitem__, self.codes)
+
+
+# Открытый колоночный файл. Числовые столбцы возвращаются как memoryview
+# поверх mmap без копирования: sum(), min(), max() по столбцу читают только его страницы
+class ColumnarFile:
+    def __init__(self, file_path):
+        self.file = open(file_path, "rb")
+        try:
+            header, self.base = read_header_bytes(self.file)
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.file.close()
+            raise
+        self.fields = header.get("fields", [])
+        self.key_fields = header.get("key_fields", [])
+        self.rows = header["rows"]
+        self.columns = header["columns"]
+        self.swap = header.get("byteorder", sys.byteorder) != sys.byteorder
+        self.cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.rows
+
+    def close(self):
+        self.cache.clear()
+        self.map.close()
+        self.file.close()
+
+    def part(self, info, name, typecode=None):
+        offset, length = info[name]
+        view = memoryview(self.map)[self.base + offset:self.base + offset + length]
+        if typecode is None:
+            return view
+        if self.swap:
+            values = array(typecode, view.tobytes())
+            values.byteswap()
+            return values
+        return view.cast(typecode)
+
+    def column(self, name):
+        if name not in self.cache:
+            info = self.columns[name]
+            if info["type"] in TYPECODES:
+                self.cache[name] = self.part(info, "data", info.get("typecode", TYPECODES[info["type"]]))
+            elif "codes" in info:
+                offsets_typecode = info["offsets_typecode"]
+                values = list(StringColumn(self.part(info, "dictionary_offsets", offsets_typecode), self.part(info, "bytes")))
+                self.cache[name] = DictionaryColumn(self.part(info, "codes", info["codes_typecode"]), values)
+            elif "width" in info:
+                self.cache[name] = StringColumn(None, self.part(info, "bytes"), info["width"], self.rows)
+            else:
+                offsets = self.part(info, "offsets", info.get("offsets_typecode", "Q"))
+                self.cache[name] = StringColumn(offsets, self.part(info, "bytes"))
+        return self.cache[name]
+
+    def nulls(self, name):
+        info = self.columns[name]
+        return self.part(info, "nulls") if "nulls" in info else None
+
+    def value(self, name, i):
+        nulls = self.nulls(name)
+        if nulls is not None and nulls[i]:
+            return None
+        return self.column(name)[i]
+
+    # Значения столбца списком, пустые — None
+    def column_values(self, name):
+        values = self.column(name)
+        nulls = self.nulls(name)
+        if nulls is None:
+            return list(values)
+        return [None if empty else value for value, empty in zip(values, nulls)]
+
+    # Количество, сумма, минимум и максимум по числовому столбцу (пустые значения пропускаются)
+    def column_stats(self, name):
+        values = self.column(name)
+        nulls = self.nulls(name)
+        if nulls is not None:
+            values = [value for value, empty in zip(values, nulls) if not empty]
+        if not len(values):
+            return {"count": 0, "sum": 0, "min": None, "max": None}
+        return {"count": len(values), "sum": sum(values), "min": min(values), "max": max(values)}
+
+    def record(self, i):
+        return {field["name"]: self.value(field["name"], i) for field in self.fields}
+
+    def __iter__(self):
+        names = [field["name"] for field in self.fields]
+        columns = [self.column(name) for name in names]
+        masks = [self.nulls(name) for name in names]
+        for i in range(self.rows):
+            yield {
+                name: None if mask is not None and mask[i] else column[i]
+                for name, column, mask in zip(names, columns, masks)
+            }
+
+
+def iter_columnar(file_path):
+    with ColumnarFile(file_path) as table:
+        yield from table
+
+
+def read_columnar(file_path):
+    with ColumnarFile(file_path) as table:
+        return table.fields, list(table), table.key_fields
@@ -0,0 +1,342 @@
+import os
+from contextlib import contextmanager
+from itertools import compress, count
+
+import storage
+import indexes
+import packed
+import history
+
+# С какого числа изменений в одной записи вторичные индексы строятся заново
+# после применения, а не обновляются по строке (вставка в сортированный
+# индекс сдвигает список, и большая пачка обходилась бы квадратично)
+REBUILD_ENTRIES = 10000
+
+
+# Создание вторичных индексов: объявленных в схеме и по ключевым полям.
+# Индекс единственного ключевого поля берётся из первичного индекса, если он есть
+def create_indices(fields, rows, key_fields, primary_index=None):
+    table_indexes = indexes.TableIndexes(fields, key_fields)
+    table_indexes.build(rows, primary_index)
+    return table_indexes
+
+
+# Ключ сортировки: строки отдельно от чисел, чтобы смешанные значения не ломали сравнение
+def sort_key(value):
+    return isinstance(value, str), value
+
+
+# Отпечаток базы: снимок и журнал. Если он изменился, файл правили снаружи
+def database_stamp(file_path):
+    stamp = storage.file_stamp(file_path)
+    log = storage.log_path(file_path)
+    if os.path.exists(log):
+        stamp += storage.file_stamp(log)
+    return stamp
+
+
+# Открытая база данных. Файл разбирается один раз, схема, строки и индексы
+# живут в памяти и общие для всех окон. Строки хранятся с постоянными номерами
+# (удалённые — None), первичный индекс: составной ключ -> номер строки
+class Database:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.batch_depth = 0
+        # GUI выключает свёртку при записи и сворачивает журнал в фоне сам
+        self.auto_compact = True
+        self.load()
+
+    def load(self):
+        self.fields, self.rows, self.key_fields = storage.load_rows(self.file_path)
+        # Строки уже в памяти, поэтому первичный индекс строится по ним (это
+        # быстрее разбора .idx); файл индекса перезаписывается, только если устарел
+        self.primary_index = {}
+        if self.key_fields:
+            self.primary_index = storage.build_index(self.rows, self.key_fields)
+            if not storage.index_current(self.file_path):
+                storage.save_index(self.file_path, self.primary_index, self.key_fields, len(self.rows))
+        self.indices = create_indices(self.fields, self.rows, self.key_fields, self.primary_index)
+        self.reset_positions()
+        self.pending = []
+        self.pending_changes = []
+        self.stamp = database_stamp(self.file_path)
+        # История отмены; step — образы строк текущего действия, пока оно записывается
+        self.history = history.History(self.file_path)
+        self.history.load(self.stamp)
+        self.step = None
+        self.deferred_indexes = False
+
+    # Перечитывание файла, только если его изменили снаружи
+    def refresh(self):
+        if self.pending or database_stamp(self.file_path) == self.stamp:
+            return False
+        self.load()
+        return True
+
+    def records(self):
+        return [record for record in self.rows if record is not None]
+
+    # Позиции живых записей: позиция в таблице -> номер строки.
+    # Пока удалённых строк нет, это просто range и ничего не строится.
+    # cache — производные данные (перестановки сортировки, столбцы для агрегатов),
+    # сбрасываются при любом изменении строк
+    def reset_positions(self):
+        self.deleted = self.rows.count(None)
+        self.positions = None
+        self.cache = {}
+
+    def row_ids(self):
+        if not self.deleted:
+            return range(len(self.rows))
+        if self.positions is None:
+            self.positions = list(compress(count(), packed.alive(self.rows)))
+        return self.positions
+
+    def count(self):
+        return len(self.rows) - self.deleted
+
+    # Номера живых строк, упорядоченные по полю; пустые и нечисловые (для
+    # сортированного индекса) значения идут в конце. Для поля с сортированным
+    # индексом порядок берётся из индекса, иначе сортируется один раз и кешируется
+    def sorted_ids(self, field, descending=False):
+        key = ("sort", field, descending)
+        if key in self.cache:
+            return self.cache[key]
+
+        if ("sort", field) not in self.cache:
+            index = self.indices.indexes.get(field)
+            if isinstance(index, indexes.SortedIndex):
+                ordered = index.rows
+                listed = set(ordered)
+                missing = [row for row in self.row_ids() if row not in listed]
+            else:
+                column = packed.column(self.rows, field)
+                present = [row for row in self.row_ids() if column[row] is not None]
+                missing = [row for row in self.row_ids() if column[row] is None]
+                values = [column[row] for row in present]
+                # Сортировка по списку значений с ключом-методом списка идёт без вызовов
+                # Python-функций; sort_key нужен, только если в поле есть и строки, и числа
+                try:
+                    order = sorted(range(len(values)), key=values.__getitem__)
+                except TypeError:
+                    order = sorted(range(len(values)), key=lambda i: sort_key(values[i]))
+                ordered = [present[i] for i in order]
+            self.cache[("sort", field)] = (ordered, missing)
+
+        ordered, missing = self.cache[("sort", field)]
+        self.cache[key] = list(ordered[::-1] if descending else ordered) + missing
+        return self.cache[key]
+
+    # Записи с позиции start (для постраничного просмотра); order — (поле, по убыванию) или None
+    def page(self, start, size, order=None):
+        row_ids = self.sorted_ids(*order) if order else self.row_ids()
+        return packed.take(self.rows, row_ids[start:start + size])
+
+    # Обработчик изменения строки при записи в журнал
+    def on_change(self, row, old, new):
+        if self.step is not None:
+            self.step.append((old, new))
+        if not self.deferred_indexes:
+            self.indices.update(row, old, new)
+        if old is not None and new is None:
+            self.deleted += 1
+        self.positions = None
+        self.cache.clear()
+
+    def has_records(self):
+        return self.count() > 0
+
+    def field_type(self, name):
+        return next((field["type"] for field in self.fields if field["name"] == name), "str")
+
+    def key_of(self, record):
+        return storage.record_key(record, self.key_fields)
+
+    # Запись по составному ключу или None
+    def find(self, key):
+        row = self.primary_index.get(tuple(key))
+        return None if row is None else self.rows[row]
+
+    # Записи по условию: по вторичному индексу или перебором
+    def search(self, field, op, value, upper=None):
+        return packed.take(self.rows, self.indices.search(self.rows, field, op, value, upper))
+
+    # Сохранение изменений одним шагом истории
+    def commit(self, entries):
+        with self.recording():
+            self.write(entries)
+
+    # Сохранение изменений: дописываем в журнал, индексы обновляются на месте
+    def write(self, entries):
+        if not self.key_fields:
+            raise ValueError("Ключевые поля не указаны!")
+
+        compacted = None
+        self.deferred_indexes = len(entries) >= REBUILD_ENTRIES
+        try:
+            if self.batch_depth:
+                # Групповая запись: изменения сразу видны в памяти, на диск уходят в flush()
+                self.pending_changes += storage.apply_entries(self.rows, self.primary_index, entries, self.key_fields, self.on_change)
+                self.pending += entries
+                return
+
+            if storage.LOG_MODE:
+                storage.log_changes(self.file_path, entries, self.key_fields, self.rows, self.primary_index, self.on_change)
+                if self.auto_compact:
+                    compacted = storage.compact_if_needed(self.file_path, self.fields, self.rows, self.key_fields)
+            else:
+                storage.apply_entries(self.rows, self.primary_index, entries, self.key_fields, self.on_change)
+                compacted = storage.compact(self.file_path, self.fields, self.rows, self.key_fields)
+        finally:
+            # После свёртки индексы всё равно строятся заново в reset_rows
+            if self.deferred_indexes:
+                self.deferred_indexes = False
+                if compacted is None:
+                    self.indices = create_indices(self.fields, self.rows, self.key_fields, self.primary_index)
+
+        # После свёртки номера строк меняются
+        if compacted is not None:
+            self.reset_rows(*compacted)
+        self.stamp = database_stamp(self.file_path)
+
+    # Действие пользователя: все изменения строк внутри блока становятся одним
+    # шагом истории (вложенные блоки входят в шаг внешнего). Шаг сохраняется и
+    # при ошибке — в нём только те изменения, что уже применены.
+    # Без ключевых полей отменить изменения нечем, поэтому история не ведётся
+    @contextmanager
+    def recording(self):
+        if self.step is not None:
+            yield
+            return
+        self.step = []
+        try:
+            yield
+        finally:
+            step, self.step = self.step, None
+            if step and self.key_fields:
+                self.history.push(step, self.stamp)
+
+    # Групповая запись: все изменения внутри with db.batch() попадают на диск
+    # одной записью в журнал с одним fsync при выходе из блока
+    @contextmanager
+    def batch(self):
+        with self.recording():
+            self.batch_depth += 1
+            try:
+                yield self
+            finally:
+                self.batch_depth -= 1
+                if not self.batch_depth:
+                    self.flush()
+
+    # Отмена последнего действия: в журнал пишутся обратные изменения
+    def undo(self):
+        changes = self.history.last_done()
+        self.write(history.undo_entries(changes, self.key_fields))
+        self.history.undone(self.stamp)
+
+    def redo(self):
+        changes = self.history.last_undone()
+        self.write(history.redo_entries(changes, self.key_fields))
+        self.history.redone(self.stamp)
+
+    # Запись накопленных в batch() изменений
+    def flush(self):
+        if not self.pending:
+            return
+        entries, changes = self.pending, self.pending_changes
+        self.pending = []
+        self.pending_changes = []
+
+        if storage.LOG_MODE:
+            storage.append_log(self.file_path, entries)
+            storage.append_index_changes(self.file_path, changes)
+            compacted = None
+            if self.auto_compact:
+                compacted = storage.compact_if_needed(self.file_path, self.fields, self.rows, self.key_fields)
+        else:
+            compacted = storage.compact(self.file_path, self.fields, self.rows, self.key_fields)
+
+        if compacted is not None:
+            self.reset_rows(*compacted)
+        self.stamp = database_stamp(self.file_path)
+
+    # Журнал вырос настолько, что его пора свернуть в снимок
+    def needs_compaction(self):
+        log_size = storage.file_size(storage.log_path(self.file_path))
+        return storage.LOG_MODE and not self.pending and log_size > storage.COMPACT_THRESHOLD
+
+    # Свёртка журнала в новый снимок; номера строк после неё меняются
+    def compact(self):
+        self.reset_rows(*storage.compact(self.file_path, self.fields, self.rows, self.key_fields))
+        self.stamp = database_stamp(self.file_path)
+
+    # Полная перезапись файла (схема могла измениться)
+    def rewrite(self, data, fields=None):
+        if fields is not None:
+            indexes.TableIndexes(fields, self.key_fields)  # Проверка объявлений индексов
+            self.fields = fields
+        data, index = storage.write_snapshot(self.file_path, self.fields, data, self.key_fields)
+        # Снимок уже содержит всё, что ждало групповой записи
+        self.pending = []
+        self.pending_changes = []
+        self.reset_rows(data, index)
+        self.stamp = database_stamp(self.file_path)
+
+    def reset_rows(self, data, index=None):
+        self.rows = packed.pack_all(data)
+        self.primary_index = index if index is not None else {}
+        self.indices = create_indices(self.fields, self.rows, self.key_fields, index)
+        self.reset_positions()
+
+    def add(self, record):
+        if not self.key_fields:
+            # Без ключевых полей журнал недоступен — перезаписываем файл целиком
+            self.rewrite(self.records() + [record])
+            return
+
+        # Проверка уникальности по первичному индексу, без чтения файла
+        if self.key_of(record) in self.primary_index:
+            raise ValueError("Запись с такими ключевыми полями уже существует!")
+        self.commit([storage.add_entry(record)])
+
+    # Добавление пачки записей одной записью в журнал
+    def add_many(self, records):
+        if not self.key_fields:
+            self.rewrite(self.records() + list(records))
+            return
+
+        keys = set()
+        for record in records:
+            key = self.key_of(record)
+            if key in self.primary_index or key in keys:
+                raise ValueError(f"Запись с ключом {key} уже существует!")
+            keys.add(key)
+        self.commit([storage.add_entry(record) for record in records])
+
+    def update(self, old_key, record):
+        old_key = tuple(old_key)
+        if old_key not in self.primary_index:
+            raise ValueError(f"Запись с ключом {old_key} не найдена.")
+        new_key = self.key_of(record)
+        if new_key != old_key and new_key in self.primary_index:
+            raise ValueError("Запись с такими ключевыми полями уже существует!")
+        self.commit([storage.edit_entry(old_key, record)])
+
+    def delete(self, keys):
+        self.commit([storage.delete_entry(key) for key in keys])
+
+    # Удаление строк по номерам (для удаления по значению поля)
+    def delete_rows(self, rows):
+        rows = set(rows)
+        if self.key_fields:
+            self.delete([self.key_of(self.rows[row]) for row in sorted(rows)])
+        else:
+            self.rewrite([record for row, record in enumerate(self.rows) if record is not None and row not in rows])
+
+    # Очистка: удалённые строки целиком попадают в шаг истории
+    def clear(self):
+        with self.recording():
+            if self.key_fields:
+                self.step.extend((record, None) for record in self.rows if record is not None)
+            self.rewrite([])
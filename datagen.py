@@ -0,0 +1,147 @@
+import argparse
+import json
+import random
+import string
+import sys
+
+import storage
+
+# Генератор синтетических баз для замеров. Схема — обычный список полей
+# с дополнительным ключом "dist" (распределение значений):
+#   sequential — start, start + 1, ... (уникальные значения, годится для ключа)
+#   uniform    — int/float в [low, high], str — случайное слово длины length
+#   normal     — mean, std (для int значение округляется)
+#   choice     — одно из values, с весами weights (если заданы)
+#   zipf       — одно из values (или 0..n-1) с вероятностью ~ 1 / ранг^s
+# Ключ "dist" в файл базы не попадает.
+DEFAULT_FIELDS = [
+    {"name": "id", "type": "int", "dist": "sequential"},
+    {"name": "name", "type": "str", "dist": "uniform", "length": 8},
+    {"name": "age", "type": "int", "dist": "uniform", "low": 0, "high": 90, "index": "sorted"},
+    {"name": "city", "type": "str", "dist": "zipf", "values": ["Москва", "Санкт-Петербург", "Казань", "Тула", "Омск", "Тверь"], "index": "hash"},
+    {"name": "score", "type": "float", "dist": "normal", "mean": 50.0, "std": 15.0},
+]
+DEFAULT_KEY_FIELDS = ["id"]
+DISTRIBUTIONS = ["sequential", "uniform", "normal", "choice", "zipf"]
+
+
+# Функция: номер строки -> значение поля
+def value_maker(field, rng):
+    dist = field.get("dist", "uniform")
+    field_type = field["type"]
+
+    if dist == "sequential":
+        start = field.get("start", 0)
+        if field_type == "str":
+            prefix = field.get("prefix", field["name"])
+            return lambda i: f"{prefix}{start + i}"
+        if field_type == "float":
+            return lambda i: float(start + i)
+        return lambda i: start + i
+
+    if dist == "uniform":
+        if field_type == "int":
+            low, high = field.get("low", 0), field.get("high", 1000000)
+            return lambda i: rng.randint(low, high)
+        if field_type == "float":
+            low, high = field.get("low", 0.0), field.get("high", 1.0)
+            return lambda i: rng.uniform(low, high)
+        length = field.get("length", 8)
+        letters = field.get("alphabet", string.ascii_lowercase)
+        return lambda i: "".join(rng.choices(letters, k=length))
+
+    if dist == "normal":
+        mean, std = field.get("mean", 0.0), field.get("std", 1.0)
+        if field_type == "int":
+            return lambda i: round(rng.gauss(mean, std))
+        return lambda i: rng.gauss(mean, std)
+
+    if dist in ("choice", "zipf"):
+        values = field.get("values")
+        if values is None:
+            values = list(range(field.get("n", 100)))
+            if field_type == "str":
+                values = [f"{field['name']}{value}" for value in values]
+        if dist == "zipf":
+            s = field.get("s", 1.1)
+            weights = [1 / rank ** s for rank in range(1, len(values) + 1)]
+        else:
+            weights = field.get("weights")
+        cum_weights = None
+        if weights is not None:
+            cum_weights = []
+            total = 0
+            for weight in weights:
+                total += weight
+                cum_weights.append(total)
+        return lambda i: rng.choices(values, cum_weights=cum_weights)[0]
+
+    raise ValueError(f"Неизвестное распределение '{dist}' у поля '{field['name']}'")
+
+
+def check_schema(fields, key_fields):
+    names = [field["name"] for field in fields]
+    for field in fields:
+        if field["type"] not in ("int", "float", "str"):
+            raise ValueError(f"Неверный тип данных у поля '{field['name']}'!")
+        if field.get("dist", "uniform") not in DISTRIBUTIONS:
+            raise ValueError(f"Неизвестное распределение '{field['dist']}' у поля '{field['name']}'")
+    unknown = [name for name in key_fields if name not in names]
+    if unknown:
+        raise ValueError(f"Ключевые поля отсутствуют в схеме: {', '.join(unknown)}")
+    # Уникальность составного ключа гарантирует хотя бы одно последовательное поле
+    if key_fields and not any(field["name"] in key_fields and field.get("dist") == "sequential" for field in fields):
+        raise ValueError("Хотя бы одно ключевое поле должно иметь распределение sequential!")
+
+
+# Схема для файла базы (без параметров генерации)
+def schema_fields(fields):
+    return [
+        {key: value for key, value in field.items() if key in ("name", "type", "index")}
+        for field in fields
+    ]
+
+
+# Записи по одной, без накопления в памяти
+def iter_records(rows, fields=DEFAULT_FIELDS, seed=0):
+    rng = random.Random(seed)
+    makers = [(field["name"], value_maker(field, rng)) for field in fields]
+    for i in range(rows):
+        yield {name: make(i) for name, make in makers}
+
+
+# Создание базы из rows записей. Формат задаётся расширением файла
+def generate(file_path, rows, fields=DEFAULT_FIELDS, key_fields=DEFAULT_KEY_FIELDS, seed=0):
+    check_schema(fields, key_fields)
+    records = iter_records(rows, fields, seed)
+    # Первичный индекс строится при первом открытии базы
+    storage.replace_snapshot(file_path, lambda temp_path: storage.write_file(temp_path, schema_fields(fields), records, key_fields))
+    return file_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генератор синтетической базы данных")
+    parser.add_argument("file", help="файл базы (.json, .jsonl, .col, .parts или .blk)")
+    parser.add_argument("rows", type=int, help="число записей")
+    parser.add_argument("--schema", help="JSON-файл со списком полей (с ключом dist)")
+    parser.add_argument("--key-fields", help="ключевые поля через запятую")
+    parser.add_argument("--seed", type=int, default=0, help="начальное значение генератора случайных чисел")
+    args = parser.parse_args(argv)
+
+    fields = DEFAULT_FIELDS
+    if args.schema:
+        with open(args.schema, "r", encoding="utf-8") as schema_file:
+            fields = json.load(schema_file)
+    key_fields = DEFAULT_KEY_FIELDS if args.key_fields is None else [key.strip() for key in args.key_fields.split(",") if key.strip()]
+
+    try:
+        generate(args.file, args.rows, fields, key_fields, args.seed)
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    print(f"Создана база {args.file}: {args.rows} записей")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import csv
+import json
+import os
+from itertools import islice
+
+import packed
+import profiler
+import query
+import storage
+
+# Выгрузка записей открытой базы в CSV, Excel (.xlsx) и JSON Lines (по записи
+# на строку, без заголовка базы). Записи берутся из базы кусками по CHUNK_ROWS
+# и сразу пишутся в файл, поэтому память не зависит от размера выборки.
+# Необязательный запрос на языке query задаёт условие, столбцы и LIMIT.
+# Файл пишется через write_atomic: прерванная выгрузка не оставляет неполного файла
+CHUNK_ROWS = 10000
+FORMATS = [".csv", ".xlsx", ".jsonl"]
+FILETYPES = [("CSV files", "*.csv"), ("Excel files", "*.xlsx"), ("JSON Lines files", "*.jsonl")]
+# Строк на листе Excel, считая строку заголовка
+EXCEL_MAX_ROWS = 1048576
+
+
+def export_format(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Выгрузка поддерживает только {', '.join(FORMATS)}: {file_path}")
+    return extension
+
+
+# Значения столбцов columns кусками по chunk_rows записей. Для упакованных строк
+# с теми же полями в том же порядке значения берутся кортежем целиком
+def value_chunks(records, columns, chunk_rows):
+    names = tuple(columns)
+    records = iter(records)
+    while True:
+        chunk = [
+            record.values() if isinstance(record, packed.Record) and record.names == names
+            else [record.get(name) for name in columns]
+            for record in islice(records, chunk_rows)
+        ]
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_csv(file_path, columns, chunks):
+    with open(file_path, "w", encoding="utf-8-sig", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            yield len(chunk)
+
+
+def write_jsonl(file_path, columns, chunks):
+    with open(file_path, "w", encoding="utf-8") as jsonl_file:
+        for chunk in chunks:
+            jsonl_file.writelines(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + "\n" for values in chunk)
+            yield len(chunk)
+
+
+# Лист Excel в режиме write_only: строки сразу уходят во временный XML,
+# книга целиком в памяти не строится
+def write_xlsx(file_path, columns, chunks):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns)
+    written = 1
+    for chunk in chunks:
+        written += len(chunk)
+        if written > EXCEL_MAX_ROWS:
+            raise ValueError(f"На лист Excel помещается не больше {EXCEL_MAX_ROWS - 1} записей, выберите CSV или JSON Lines")
+        for values in chunk:
+            sheet.append(values)
+        yield len(chunk)
+    workbook.save(file_path)
+
+
+WRITERS = {".csv": write_csv, ".xlsx": write_xlsx, ".jsonl": write_jsonl}
+
+
+# Выгрузка записей базы db (database.Database) в файл; формат — по расширению.
+# text — запрос или условие (None — все записи и все поля).
+# progress(выгружено записей, всего или None) вызывается после каждого куска.
+# Возвращает число выгруженных записей
+@profiler.timed("export")
+def export(db, file_path, text=None, progress=None, chunk_rows=CHUNK_ROWS):
+    writer = WRITERS[export_format(file_path)]
+    if text:
+        columns, records = query.stream(db, text)
+        total = None
+    else:
+        columns = [field["name"] for field in db.fields]
+        records = (record for record in db.rows if record is not None)
+        total = db.count()
+
+    state = {"done": 0}
+    def write(temp_path):
+        for written in writer(temp_path, columns, value_chunks(records, columns, chunk_rows)):
+            state["done"] += written
+            if progress is not None:
+                progress(state["done"], total)
+
+    storage.write_atomic(file_path, write)
+    profiler.count("export", bytes_written=storage.file_size(file_path), rows_returned=state["done"])
+    return state["done"]
@@ -3,164 +3,183 @@ from tkinter import ttk, messagebox
 from tkinter.filedialog import askopenfilename, asksaveasfilename
 from tkinter import filedialog
 import os
-import json
 import shutil
-import pandas as pd
+import time
+import storage
+import indexes
+import database
+import query
+import workers
+import backup
+import profiler
+import aggregate
+import export
+import history
+import partition
 
 selected_file = None
 
-def select_file():
-    file_path = filedialog.asksaveasfilename(defaultextension=".db", filetypes=[("Database files", "*.db")])
-    return file_path
+# Главное окно; создаётся в main_window(), при импорте модуля окно не открывается
+root = None
 
-def read_db(file_path):
-    try:
-        with open(file_path, "r") as db_file:
-            db_data = json.load(db_file)
-            return db_data.get("fields", []), db_data.get("data", []), db_data.get("key_fields", [])
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Не удалось прочитать файл: {e}")
-        return [], [], []
+# Открытая база данных (database.Database), общая для всех окон
+db = None
 
+# Поддерживаемые форматы файлов базы
+DB_FILETYPES = [("JSON files", "*.json"), ("JSON Lines files", "*.jsonl"), ("Columnar files", "*.col"), ("Partitioned files", "*.parts"), ("Compressed block files", "*.blk")]
 
+# Сколько строк просмотрщик показывает до первого изменения размера окна
+VIEW_PAGE_ROWS = 20
+
+# С какого числа записей сортировка в просмотрщике выполняется в фоне
+SORT_BACKGROUND_ROWS = 100000
+
+# Сколько найденных записей окно запроса выводит в таблицу
+QUERY_VIEW_ROWS = 1000
+
+# Как часто окно прогресса забирает сообщения фоновой операции, мс
+POLL_MS = 100
+
+# Сколько фоновых операций идёт сейчас; пока они идут, Ctrl+Z и Ctrl+Y не действуют
+background_tasks = 0
+
+# С какого числа изменений в шаге отмена и повтор выполняются в фоне
+UNDO_BACKGROUND_CHANGES = database.REBUILD_ENTRIES
+
+def select_file():
+    file_path = filedialog.asksaveasfilename(defaultextension=".db", filetypes=[("Database files", "*.db")])
+    return file_path
 
 def write_db(file_path, fields, data, key_fields=None):
     try:
-        # Формирование данных для сохранения
-        db_data = {"fields": fields, "data": data}
-        if key_fields is not None:
-            db_data["key_fields"] = key_fields
-
-        # Запись данных в файл
-        with open(file_path, "w", encoding="utf-8") as db_file:
-            json.dump(db_data, db_file, indent=4, ensure_ascii=False)
+        # Полная перезапись файла, журнал изменений при этом сворачивается
+        storage.write_snapshot(file_path, fields, data, key_fields)
     except Exception as e:
         messagebox.showerror("Ошибка", f"Не удалось записать в файл: {e}")
 
-def get_key_fields(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        db = json.load(f)
-        if "key_fields" not in db or not db["key_fields"]:
-            raise ValueError("Ключевые поля не указаны!")
-        return db["key_fields"]
-
-
-def is_unique(file_path, new_record, key_fields):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        db = json.load(f)
-        for record in db["data"]:
-            if all(record[field] == new_record[field] for field in key_fields):
-                return False  # Дублирование найдено
-    return True
-
-
-# Создание индексов по ключевым полям
-def create_indices(data, key_fields):
-    indices = {}
-    for key_field in key_fields:
-        index = {}
-        for record in data:
-            key = record.get(key_field)
-            if key in index:
-                index[key].append(record)
+# Открытая база, перечитанная с диска, если файл изменили снаружи
+def current_db():
+    if not selected_file or db is None:
+        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+        return None
+    try:
+        db.refresh()
+    except Exception as e:
+        messagebox.showerror("Ошибка", f"Не удалось прочитать файл: {e}")
+        return None
+    return db
+
+
+# Долгая операция в фоновом потоке с окном прогресса и кнопкой отмены.
+# work(task) выполняется в пуле workers и не должна трогать окна Tk;
+# on_done(результат) вызывается уже в главном потоке. Пока операция идёт,
+# окно прогресса модальное, поэтому с открытой базой никто больше не работает
+def run_in_background(title, work, on_done, error_text, cancellable=True):
+    global background_tasks
+    background_tasks += 1
+    window = tk.Toplevel(root)
+    window.title(title)
+    window.geometry("360x130")
+    window.resizable(False, False)
+
+    label = tk.Label(window, text=title)
+    label.pack(pady=10)
+    bar = ttk.Progressbar(window, length=320, mode="indeterminate")
+    bar.pack(pady=5)
+    bar.start(50)
+
+    def cancel():
+        if cancellable:
+            cancel_button.config(state=tk.DISABLED)
+            label.config(text="Отмена...")
+            task.cancel()
+
+    cancel_button = tk.Button(window, text="Отмена", command=cancel, state=tk.NORMAL if cancellable else tk.DISABLED)
+    cancel_button.pack(pady=5)
+    window.protocol("WM_DELETE_WINDOW", cancel)
+    window.transient(root)
+    window.grab_set()
+
+    task = workers.Task(work)
+
+    def poll():
+        global background_tasks
+        for kind, value in task.poll():
+            if kind == "progress":
+                done, total = value
+                if total:
+                    bar.stop()
+                    bar.config(mode="determinate", maximum=total, value=done)
+                    label.config(text=f"{title}: {done} из {total}")
+                elif not task.cancelled():
+                    label.config(text=f"{title}: {done}")
+                continue
+
+            background_tasks -= 1
+            window.grab_release()
+            window.destroy()
+            if kind == "done":
+                on_done(value)
+            elif kind == "error":
+                messagebox.showerror("Ошибка", f"{error_text}: {value}")
             else:
-                index[key] = [record]
-        indices[key_field] = index
-    return indices
+                messagebox.showinfo("Отмена", "Операция отменена.")
+            return
+        window.after(POLL_MS, poll)
 
+    window.after(POLL_MS, poll)
 
-# Обновление индексов при добавлении или удалении записей
-def update_index(index, record, field_name, operation="add"):
-    key = record.get(field_name)
-    if operation == "add":
-        if key in index:
-            index[key].append(record)
-        else:
-            index[key] = [record]
-    elif operation == "remove":
-        if key in index and record in index[key]:
-            index[key].remove(record)
-            if not index[key]:
-                del index[key]
-
-
-def build_index(file_path):
-    with open(file_path, 'r+', encoding='utf-8') as f:
-        db = json.load(f)
-        key_fields = db["key_fields"]
-
-        # Создаем индекс как словарь
-        index = {}
-        for i, record in enumerate(db["data"]):
-            key = tuple(record[field] for field in key_fields)
-            if key in index:
-                raise ValueError(f"Дублирование ключа: {key}")
-            index[key] = i  # Сохраняем индекс строки
-
-        # Сохраняем индекс в файл
-        db["index"] = index
-        f.seek(0)
-        json.dump(db, f, ensure_ascii=False, indent=4)
-        f.truncate()
-
-def save_index_to_file(db_file_path, index_file_path):
-    with open(db_file_path, 'r', encoding='utf-8') as db_file:
-        db = json.load(db_file)
-        key_fields = db["key_fields"]
-
-        # Построение индекса
-        index = {}
-        for i, record in enumerate(db["data"]):
-            key = tuple(record[field] for field in key_fields)
-            if key in index:
-                raise ValueError(f"Дублирование ключа: {key}")
-            index[key] = i
-
-    # Сохраняем индекс в отдельный файл
-    with open(index_file_path, 'w', encoding='utf-8') as index_file:
-        json.dump(index, index_file, ensure_ascii=False, indent=4)
 
+# Поля ввода для всех ключевых полей
+def create_key_entries(dialog):
+    entries = {}
+    for key_field in db.key_fields:
+        tk.Label(dialog, text=f"Введите значение ключевого поля ({key_field}):").pack(pady=5)
+        entry = tk.Entry(dialog)
+        entry.pack(pady=5)
+        entries[key_field] = entry
+    return entries
 
-def add_record(file_path, new_record):
-    with open(file_path, 'r+', encoding='utf-8') as f:
-        db = json.load(f)
 
-        # Проверка уникальности по ключевым полям
-        key_fields = db["key_fields"]
-        if not is_unique(file_path, new_record, key_fields):
-            raise ValueError("Запись с такими ключевыми полями уже существует!")
+# Составной ключ из полей ввода с приведением к типам схемы
+def read_key(entries):
+    return tuple(storage.convert_value(db.field_type(name), entries[name].get().strip()) for name in db.key_fields)
 
-        # Добавляем запись
-        db["data"].append(new_record)
 
-        # Перезаписываем файл
-        f.seek(0)
-        json.dump(db, f, ensure_ascii=False, indent=4)
-        f.truncate()
+def add_record(file_path, new_record):
+    if file_path != selected_file or db is None:
+        raise ValueError("Запись можно добавить только в открытую базу данных!")
+    db.add(new_record)
+    compact_in_background()
 
 def delete_record_dialog(selected_file, root):
     # Проверка, что файл выбран
-    if not selected_file:
-        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+    if current_db() is None:
         return
 
-    # Чтение данных из базы
-    fields, data, key_fields = read_db(selected_file)
-    if not data:
+    if not db.key_fields:
+        messagebox.showerror("Ошибка", "В базе данных не указаны ключевые поля.")
+        return
+    if not db.has_records():
         messagebox.showerror("Ошибка", "База данных пуста или не может быть прочитана.")
         return
 
     def delete_record():
-        # Получение ключевого значения от пользователя
-        key_value = key_entry.get().strip()
-        filtered_data = [record for record in data if str(record[key_field]) != key_value]
+        # Получение ключа от пользователя и поиск по первичному индексу
+        try:
+            key = read_key(key_entries)
+        except ValueError:
+            messagebox.showerror("Ошибка", "Некорректное значение ключевого поля!")
+            return
 
-        if len(filtered_data) == len(data):
+        key_value = ", ".join(str(value) for value in key)
+        if db.find(key) is None:
             messagebox.showwarning("Не найдено", f"Запись с ключом {key_value} не найдена.")
         else:
             try:
                 # Запись изменений в файл
-                write_db(selected_file, fields, filtered_data, key_fields)
+                db.delete([key])
+                compact_in_background()
                 messagebox.showinfo("Успех", f"Запись с ключом {key_value} удалена.")
                 dialog.destroy()
             except Exception as e:
@@ -169,13 +188,10 @@ def delete_record_dialog(selected_file, root):
     # Создание диалогового окна
     dialog = tk.Toplevel(root)
     dialog.title("Удалить запись")
-    dialog.geometry("300x200")
+    dialog.geometry("300x250")
 
     # Поля ввода
-    tk.Label(dialog, text=f"Введите значение ключевого поля ({key_fields[0]}):").pack(pady=10)
-    key_field = key_fields[0]  # Используем первое ключевое поле
-    key_entry = tk.Entry(dialog)
-    key_entry.pack(pady=10)
+    key_entries = create_key_entries(dialog)
 
     # Кнопка удаления
     delete_button = tk.Button(dialog, text="Удалить", command=delete_record)
@@ -185,13 +201,10 @@ def delete_record_dialog(selected_file, root):
 
 # Функция удаления записи по значению произвольного поля
 def delete_record_by_field():
-    global indices  # Для работы с индексами
-
-    if not selected_file:
-        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+    if current_db() is None:
         return
 
-    fields, data, key_fields = read_db(selected_file)
+    fields = db.fields
 
     if not fields:
         messagebox.showerror("Ошибка", "Не удалось загрузить поля из базы данных!")
@@ -207,23 +220,26 @@ def delete_record_by_field():
     if not field_value:
         return
 
-    # Ищем записи, которые нужно удалить
-    records_to_remove = [record for record in data if str(record.get(field_name)) == field_value]
-
-    if not records_to_remove:
-        messagebox.showinfo("Результат", "Записи не найдены.")
+    try:
+        field_value = storage.convert_value(db.field_type(field_name), field_value)
+    except ValueError:
+        messagebox.showerror("Ошибка", f"Некорректное значение для поля '{field_name}'!")
         return
 
-    # Удаляем найденные записи
-    data = [record for record in data if str(record.get(field_name)) != field_value]
+    # Ищем записи, которые нужно удалить (по индексу, если поле индексировано)
+    rows_to_remove = db.indices.search(db.rows, field_name, "=", field_value)
 
-    # Обновляем индекс, если поле индексировано
-    if field_name in indices:
-        for record in records_to_remove:
-            update_index(indices[field_name], record, field_name, operation="remove")
+    if not rows_to_remove:
+        messagebox.showinfo("Результат", "Записи не найдены.")
+        return
 
-    # Записываем изменения в файл
-    write_db(selected_file, fields, data, key_fields)
+    # Записываем изменения в файл; индексы обновляются вместе с журналом
+    try:
+        db.delete_rows(rows_to_remove)
+    except Exception as e:
+        messagebox.showerror("Ошибка", f"Не удалось удалить записи: {e}")
+        return
+    compact_in_background()
     messagebox.showinfo("Успех", "Записи успешно удалены!")
 
 # Функция создания диалога для ввода данных
@@ -252,22 +268,28 @@ def simple_input_dialog(prompt):
     return result
 
 def search_record_dialog():
-    if not selected_file:
-        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+    if current_db() is None:
         return
 
-    fields, data, key_fields = read_db(selected_file)
-    if not data:
+    fields = db.fields
+    if not db.has_records():
         messagebox.showerror("Ошибка", "База данных пуста или не может быть прочитана.")
         return
 
     def perform_search():
         search_field = field_var.get()
-        search_value = search_entry.get().strip()
+        op = op_var.get()
+        try:
+            search_value = storage.convert_value(db.field_type(search_field), search_entry.get().strip())
+            upper_value = None
+            if op == "between":
+                upper_value = storage.convert_value(db.field_type(search_field), upper_entry.get().strip())
+        except ValueError:
+            messagebox.showerror("Ошибка", f"Некорректное значение для поля '{search_field}'!")
+            return
 
-        results = [
-            record for record in data if str(record[search_field]) == search_value
-        ]
+        # Поиск по вторичному индексу, если он есть, иначе перебором
+        results = db.search(search_field, op, search_value, upper_value)
 
         if results:
             result_text.delete(1.0, tk.END)
@@ -278,7 +300,7 @@ def search_record_dialog():
 
     dialog = tk.Toplevel(root)
     dialog.title("Поиск записи")
-    dialog.geometry("400x300")
+    dialog.geometry("400x420")
 
     tk.Label(dialog, text="Выберите поле для поиска:").pack(pady=5)
     field_var = tk.StringVar(dialog)
@@ -286,9 +308,17 @@ def search_record_dialog():
     field_menu = tk.OptionMenu(dialog, field_var, *[f["name"] for f in fields])
     field_menu.pack(pady=5)
 
-    tk.Label(dialog, text="Введите значение для поиска:").pack(pady=5)
+    tk.Label(dialog, text="Условие:").pack(pady=5)
+    op_var = tk.StringVar(dialog)
+    op_var.set("=")
+    op_menu = tk.OptionMenu(dialog, op_var, *indexes.OPERATORS)
+    op_menu.pack(pady=5)
+
+    tk.Label(dialog, text="Введите значение для поиска (для between — нижнюю и верхнюю границы):").pack(pady=5)
     search_entry = tk.Entry(dialog)
     search_entry.pack(pady=5)
+    upper_entry = tk.Entry(dialog)
+    upper_entry.pack(pady=5)
 
     search_button = tk.Button(dialog, text="Искать", command=perform_search)
     search_button.pack(pady=10)
@@ -297,18 +327,66 @@ def search_record_dialog():
     result_text.pack(pady=5)
 
 
-def search_record_by_field():
-    global indices  # Индексы для быстрого доступа
+# Запрос на языке query.py: несколько условий, проекция, LIMIT и план выполнения
+def query_dialog():
+    if current_db() is None:
+        return
 
-    if not selected_file:
-        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+    def run_query(show_plan_only=False):
+        if current_db() is None:
+            return
+        text = query_text.get(1.0, tk.END).strip()
+        try:
+            if show_plan_only:
+                plan_label.config(text=f"План: {query.explain(db, text)}")
+                return
+            columns, found, description = query.execute(db, text)
+        except ValueError as e:
+            messagebox.showerror("Ошибка", f"Ошибка в запросе: {e}")
+            return
+
+        plan_label.config(text=f"План: {description}")
+        treeview.delete(*treeview.get_children())
+        treeview["columns"] = columns
+        for column in columns:
+            treeview.heading(column, text=column)
+            treeview.column(column, width=100)
+        for record in found[:QUERY_VIEW_ROWS]:
+            treeview.insert("", tk.END, values=[record.get(column) for column in columns])
+        shown = min(len(found), QUERY_VIEW_ROWS)
+        count_label.config(text=f"Найдено записей: {len(found)}" + (f" (показаны первые {shown})" if shown < len(found) else ""))
+
+    dialog = tk.Toplevel(root)
+    dialog.title("Запрос")
+    dialog.geometry("700x500")
+
+    tk.Label(dialog, text="Запрос (например: SELECT поле1, поле2 WHERE поле1 >= 10 AND поле2 IN (a, b) LIMIT 100):").pack(pady=5)
+    query_text = tk.Text(dialog, width=80, height=4)
+    query_text.pack(pady=5)
+
+    buttons = tk.Frame(dialog)
+    buttons.pack(pady=5)
+    tk.Button(buttons, text="Выполнить", command=run_query).pack(side=tk.LEFT, padx=5)
+    tk.Button(buttons, text="План", command=lambda: run_query(True)).pack(side=tk.LEFT, padx=5)
+    tk.Button(buttons, text="Выгрузить", command=lambda: export_records(query_text.get(1.0, tk.END).strip() or None)).pack(side=tk.LEFT, padx=5)
+
+    plan_label = tk.Label(dialog, text="", wraplength=680, justify=tk.LEFT)
+    plan_label.pack(pady=5)
+    count_label = tk.Label(dialog, text="")
+    count_label.pack()
+
+    treeview = ttk.Treeview(dialog, show="headings")
+    treeview.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+
+
+def search_record_by_field():
+    if current_db() is None:
         return
 
-    # Читаем данные из файла
-    fields, data, key_fields = read_db(selected_file)
+    fields = db.fields
 
     # Проверяем, что есть данные
-    if not fields or not data:
+    if not fields or not db.has_records():
         messagebox.showerror("Ошибка", "База данных пуста или не содержит полей.")
         return
 
@@ -323,16 +401,13 @@ def search_record_by_field():
     if not field_value:
         return
 
-    # Если поле ключевое, используем индекс
-    if field_name in key_fields:
-        if field_value.isdigit():
-            field_value = int(field_value)  # Приводим к числовому типу, если требуется
-        matching_records = indices.get(field_name, {}).get(field_value, [])
-    else:
-        # Для неключевого поля — полный перебор
-        matching_records = [
-            record for record in data if str(record.get(field_name)) == str(field_value)
-        ]
+    # Значение приводится к типу поля из схемы, затем используется индекс (если он есть)
+    try:
+        field_value = storage.convert_value(db.field_type(field_name), field_value)
+    except ValueError:
+        messagebox.showerror("Ошибка", f"Некорректное значение для поля '{field_name}'!")
+        return
+    matching_records = db.search(field_name, "=", field_value)
 
     # Вывод результата
     if matching_records:
@@ -342,6 +417,47 @@ def search_record_by_field():
         messagebox.showinfo("Результаты поиска", "Совпадений не найдено.")
 
 
+# Объявление вторичных индексов по полям схемы
+def indexes_dialog():
+    if current_db() is None:
+        return
+
+    def save_indexes():
+        fields = [dict(field) for field in db.fields]
+        for field in fields:
+            kind = kind_vars[field["name"]].get()
+            if kind == "нет":
+                field.pop("index", None)
+            else:
+                field["index"] = kind
+
+        def indexes_saved(result):
+            messagebox.showinfo("Успех", "Индексы обновлены!")
+            dialog.destroy()
+
+        # Объявления хранятся в схеме, поэтому схема перезаписывается вместе с данными.
+        # Прерванная на середине перезапись испортила бы файл, поэтому отмены нет
+        run_in_background("Построение индексов", lambda task: db.rewrite(db.records(), fields),
+                          indexes_saved, "Не удалось обновить индексы", cancellable=False)
+
+    dialog = tk.Toplevel(root)
+    dialog.title("Индексы полей")
+    dialog.geometry("400x400")
+
+    tk.Label(dialog, text="Выберите вид индекса для каждого поля", font=("Arial", 12)).pack(pady=10)
+
+    kind_vars = {}
+    for field in db.fields:
+        tk.Label(dialog, text=f"{field['name']} ({field['type']}):").pack(pady=5)
+        values = ["нет"] + [kind for kind in indexes.INDEX_KINDS if field["type"] in indexes.KIND_TYPES.get(kind, (field["type"],))]
+        kind = ttk.Combobox(dialog, values=values, state="readonly", width=10)
+        kind.set(field.get("index", "нет"))
+        kind.pack(pady=5)
+        kind_vars[field["name"]] = kind
+
+    tk.Button(dialog, text="Сохранить", command=save_indexes).pack(pady=20)
+
+
 def simple_input_dialog(prompt):
     dialog = tk.Toplevel(root)
     dialog.title(prompt)
@@ -372,57 +488,138 @@ def create_backup():
         messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
         return
 
-    backup_file = selected_file.replace(".json", "-backup.json")
-    try:
-        shutil.copy(selected_file, backup_file)
-        messagebox.showinfo("Успех", f"Резервная копия сохранена как {backup_file}")
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Не удалось создать резервную копию: {e}")
+    def backed_up(manifest):
+        messagebox.showinfo("Успех", f"Создана резервная копия №{manifest['number']}.\n"
+                                     f"Добавлено в хранилище: {manifest['stored'] // 1024} КБ")
 
+    # В хранилище попадают только куски, которых там ещё нет
+    run_in_background("Резервное копирование", lambda task: backup.create_snapshot(selected_file, task.progress),
+                      backed_up, "Не удалось создать резервную копию")
 
-# Восстановление БД из backup-файла
+
+# Восстановление БД из выбранной резервной копии
 def restore_from_backup():
-    if not selected_file:
-        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+    if current_db() is None:
         return
 
-    backup_file = askopenfilename(filetypes=[("JSON files", "*.json")])
-    if not backup_file:
+    snapshots = backup.list_snapshots(selected_file)
+    if not snapshots:
+        messagebox.showerror("Ошибка", "Для этой базы данных нет резервных копий!")
         return
 
-    try:
-        shutil.copy(backup_file, selected_file)
-        messagebox.showinfo("Успех", "База данных успешно восстановлена!")
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Не удалось восстановить базу данных: {e}")
+    def restore():
+        selection = listbox.curselection()
+        if not selection:
+            messagebox.showerror("Ошибка", "Выберите резервную копию!")
+            return
+        number = snapshots[selection[0]]["number"]
+        dialog.destroy()
+
+        file_path = selected_file
+
+        # Открытая база в фоне не трогается: восстановленная читается в новый
+        # объект и заменяет её уже в главном потоке
+        def work(task):
+            backup.restore_snapshot(file_path, number, task.progress)
+            return database.Database(file_path)
+
+        def restored(new_db):
+            global db
+            new_db.auto_compact = False
+            db = new_db
+            messagebox.showinfo("Успех", f"База данных восстановлена из копии №{number}!")
+
+        run_in_background("Восстановление из резерва", work, restored,
+                          "Не удалось восстановить базу данных")
+
+    dialog = tk.Toplevel(root)
+    dialog.title("Восстановление из резерва")
+    dialog.geometry("400x300")
+
+    tk.Label(dialog, text="Выберите резервную копию:").pack(pady=5)
+    listbox = tk.Listbox(dialog, width=60)
+    listbox.pack(expand=True, fill=tk.BOTH, padx=10, pady=5)
+    for manifest in snapshots:
+        size = sum(manifest["sizes"].values()) // 1024
+        listbox.insert(tk.END, f"№{manifest['number']}  {manifest['created']}  ({size} КБ)")
+    listbox.selection_set(tk.END)
+
+    tk.Button(dialog, text="Восстановить", command=restore).pack(pady=10)
 
 
 def import_from_excel():
-    # Выбор Excel-файла
-    file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
+    # Выбор Excel- или CSV-файла
+    file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
     if not file_path:
         messagebox.showwarning("Предупреждение", "Файл не был выбран!")
         return
 
-    # Указание файла для сохранения
-    selected_file = filedialog.asksaveasfilename(defaultextension=".db", filetypes=[("JSON files", "*.json")])
-    if not selected_file:
+    # Дописать в существующую базу или создать новую
+    append = messagebox.askyesno("Импорт", "Добавить записи в существующую базу данных?\n(Нет — создать новую базу)")
+    if append:
+        target_file = askopenfilename(filetypes=DB_FILETYPES)
+    else:
+        target_file = filedialog.asksaveasfilename(defaultextension=".json", filetypes=DB_FILETYPES)
+    if not target_file:
         messagebox.showwarning("Предупреждение", "Файл для сохранения не был выбран!")
         return
 
-    try:
-        # Чтение данных из Excel
-        df = pd.read_excel(file_path)
+    if append:
+        def work(task):
+            # pandas загружается только при первом импорте, а не при запуске программы
+            import importer
+            return importer.import_append(file_path, target_file, progress=task.progress)
 
-        # Преобразование данных в формат для записи
-        fields = [{"name": col, "type": "str"} for col in df.columns]
-        data = df.to_dict(orient="records")
+        def imported(count):
+            messagebox.showinfo("Успех", f"Импортировано записей: {count}")
+    else:
+        key_field_names = simple_input_dialog("Введите названия ключевых полей (через запятую):")
+        if not key_field_names:
+            messagebox.showerror("Ошибка", "Не указаны ключевые поля для создания индекса!")
+            return
+        key_fields = [key.strip() for key in key_field_names.split(',')]
 
-        # Сохранение данных
-        write_db(selected_file, fields, data)
-        messagebox.showinfo("Успех", "Данные успешно импортированы из Excel!")
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Не удалось импортировать данные: {e}")
+        def work(task):
+            import importer
+            return importer.import_new(file_path, target_file, key_fields, progress=task.progress)
+
+        def imported(fields):
+            types = ", ".join(f"{field['name']}: {field['type']}" for field in fields)
+            messagebox.showinfo("Успех", f"Данные успешно импортированы!\nТипы полей: {types}")
+
+    # Отмена безопасна: новая база пишется во временный файл, а дописанное
+    # в существующую откатывается
+    run_in_background("Импорт", work, imported, "Не удалось импортировать данные")
+
+# Выгрузка записей открытой базы в CSV, Excel или JSON Lines (необязательно — по запросу)
+def export_records(text=None):
+    if current_db() is None:
+        return
+    target_path = asksaveasfilename(defaultextension=".csv", filetypes=export.FILETYPES)
+    if not target_path:
+        return
+
+    run_in_background("Выгрузка", lambda task: export.export(db, target_path, text, task.progress),
+                      lambda count: messagebox.showinfo("Успех", f"Выгружено записей: {count}"),
+                      "Не удалось выгрузить записи")
+
+
+# Конвертация базы между форматами; формат задаётся расширением нового файла
+def convert_db():
+    source_path = askopenfilename(filetypes=DB_FILETYPES)
+    if not source_path:
+        return
+
+    target_path = asksaveasfilename(defaultextension=".jsonl", filetypes=DB_FILETYPES)
+    if not target_path:
+        return
+    if os.path.abspath(target_path) == os.path.abspath(source_path):
+        messagebox.showerror("Ошибка", "Выберите другой файл для сохранения!")
+        return
+
+    run_in_background("Конвертация", lambda task: storage.convert(source_path, target_path),
+                      lambda result: messagebox.showinfo("Успех", f"База данных сохранена как {os.path.basename(target_path)}"),
+                      "Не удалось конвертировать базу данных", cancellable=False)
 
 def create_db():
     def define_fields():
@@ -491,7 +688,7 @@ def create_db():
 
         tk.Button(fields_window, text="Сохранить", command=save_fields).pack(pady=20)
 
-    file_path = asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+    file_path = asksaveasfilename(defaultextension=".json", filetypes=DB_FILETYPES)
     if not file_path:
         return
 
@@ -510,11 +707,10 @@ def create_db():
     tk.Button(create_window, text="Далее", command=define_fields).pack(pady=20)
 
 def add_new_record_dialog():
-    if not selected_file:
-        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+    if current_db() is None:
         return
 
-    fields, data, key_fields = read_db(selected_file)
+    fields = db.fields
 
     if not fields:
         messagebox.showerror("Ошибка", "Не удалось получить поля из базы данных.")
@@ -525,12 +721,7 @@ def add_new_record_dialog():
     def save_record():
         try:
             for field in fields:
-                value = entries[field["name"]].get().strip()
-                if field["type"] == "int":
-                    value = int(value)
-                elif field["type"] == "float":
-                    value = float(value)
-                new_record[field["name"]] = value
+                new_record[field["name"]] = storage.convert_value(field["type"], entries[field["name"]].get().strip())
 
             add_record(selected_file, new_record)
             dialog.destroy()
@@ -555,34 +746,50 @@ def add_new_record_dialog():
 
 
 def delete_db():
-    file_path = askopenfilename(filetypes=[("JSON files", "*.json")])
+    file_path = askopenfilename(filetypes=DB_FILETYPES)
     if not file_path:
         return
 
     if messagebox.askyesno("Подтверждение", f"Вы уверены, что хотите удалить файл {os.path.basename(file_path)}?"):
+        # Резервные копии нужны как раз после ошибочного удаления, поэтому удаляются только по явному согласию
+        remove_backups = os.path.isdir(backup.backup_dir(file_path)) and messagebox.askyesno(
+            "Резервные копии", "Удалить также все резервные копии этой базы данных?")
         try:
             os.remove(file_path)
+            for path in (storage.log_path(file_path), storage.index_path(file_path), history.history_path(file_path)):
+                if os.path.exists(path):
+                    os.remove(path)
+            if partition.is_partitioned(file_path) and os.path.isdir(partition.segment_dir(file_path)):
+                shutil.rmtree(partition.segment_dir(file_path))
+            if remove_backups:
+                shutil.rmtree(backup.backup_dir(file_path))
             messagebox.showinfo("Успех", "База данных успешно удалена!")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось удалить файл: {e}")
 
 def edit_record_dialog():
-    if not selected_file:
-        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+    if current_db() is None:
         return
 
-    fields, data, key_fields = read_db(selected_file)
-    if not data:
+    fields = db.fields
+    if not db.key_fields:
+        messagebox.showerror("Ошибка", "В базе данных не указаны ключевые поля.")
+        return
+    if not db.has_records():
         messagebox.showerror("Ошибка", "База данных пуста или не может быть прочитана.")
         return
 
     def edit_record():
-        # Получение ключевого значения от пользователя
-        key_value = key_entry.get().strip()
-        key_field = key_fields[0]  # Используем первое ключевое поле для поиска
-        record_to_edit = next((record for record in data if str(record[key_field]) == key_value), None)
+        # Получение ключа от пользователя и поиск по первичному индексу
+        try:
+            old_key = read_key(key_entries)
+        except ValueError:
+            messagebox.showerror("Ошибка", "Некорректное значение ключевого поля!")
+            return
 
-        if not record_to_edit:
+        record_to_edit = db.find(old_key)
+        if record_to_edit is None:
+            key_value = ", ".join(str(value) for value in old_key)
             messagebox.showwarning("Не найдено", f"Запись с ключом {key_value} не найдена.")
             return
 
@@ -602,16 +809,13 @@ def edit_record_dialog():
             entries[field["name"]] = entry
 
         def save_changes():
-            for field in fields:
-                value = entries[field["name"]].get().strip()
-                if field["type"] == "int":
-                    value = int(value)
-                elif field["type"] == "float":
-                    value = float(value)
-                record_to_edit[field["name"]] = value
-
             try:
-                write_db(selected_file, fields, data, key_fields)
+                new_record = dict(record_to_edit)
+                for field in fields:
+                    new_record[field["name"]] = storage.convert_value(field["type"], entries[field["name"]].get().strip())
+
+                db.update(old_key, new_record)
+                compact_in_background()
                 messagebox.showinfo("Успех", "Запись успешно изменена!")
                 edit_window.destroy()
             except Exception as e:
@@ -622,54 +826,217 @@ def edit_record_dialog():
     # Окно выбора записи для редактирования
     dialog = tk.Toplevel(root)
     dialog.title("Редактировать запись")
-    dialog.geometry("300x200")
+    dialog.geometry("300x250")
 
-    tk.Label(dialog, text=f"Введите значение ключевого поля ({key_fields[0]}):").pack(pady=10)
-    key_entry = tk.Entry(dialog)
-    key_entry.pack(pady=10)
+    key_entries = create_key_entries(dialog)
 
     edit_button = tk.Button(dialog, text="Редактировать", command=edit_record)
     edit_button.pack(pady=20)
 
-def clear_database():
-    if not selected_file:
-        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+# Итоги по группам: count/sum/avg/min/max по числовому полю с группировкой по любому полю
+def aggregate_dialog():
+    if current_db() is None:
         return
 
-    if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите очистить базу данных?"):
-        fields, _, key_fields = read_db(selected_file)
+    none_label = "(нет)"
+    numeric = [field["name"] for field in db.fields if field["type"] in ("int", "float")]
+
+    def calculate():
+        if current_db() is None:
+            return
+        group_field = group_var.get()
+        value_field = value_var.get()
+        group_field = None if group_field == none_label else group_field
+        value_field = None if value_field == none_label else value_field
+
+        start = time.perf_counter()
         try:
-            write_db(selected_file, fields, [], key_fields)
-            messagebox.showinfo("Успех", "База данных успешно очищена!")
+            results = aggregate.aggregate(db, value_field, group_field)
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+
+        names = ["group"] + [name for name in aggregate.FUNCTIONS if value_field is not None or name == "count"]
+        treeview.delete(*treeview.get_children())
+        treeview["columns"] = names
+        for name in names:
+            treeview.heading(name, text=(group_field or "Итого") if name == "group" else name)
+            treeview.column(name, width=110)
+        for result in results:
+            treeview.insert("", tk.END, values=["" if result.get(name) is None else result[name] for name in names])
+        time_label.config(text=f"Групп: {len(results)}, посчитано за {elapsed:.1f} мс")
+
+    dialog = tk.Toplevel(root)
+    dialog.title("Группировка и итоги")
+    dialog.geometry("650x450")
+
+    options = tk.Frame(dialog)
+    options.pack(pady=5)
+    tk.Label(options, text="Группировать по:").pack(side=tk.LEFT, padx=5)
+    group_var = tk.StringVar(dialog, value=none_label)
+    tk.OptionMenu(options, group_var, none_label, *[field["name"] for field in db.fields]).pack(side=tk.LEFT)
+    tk.Label(options, text="Числовое поле:").pack(side=tk.LEFT, padx=5)
+    value_var = tk.StringVar(dialog, value=numeric[0] if numeric else none_label)
+    tk.OptionMenu(options, value_var, none_label, *numeric).pack(side=tk.LEFT)
+    tk.Button(options, text="Посчитать", command=calculate).pack(side=tk.LEFT, padx=10)
+
+    time_label = tk.Label(dialog, text="")
+    time_label.pack()
+    treeview = ttk.Treeview(dialog, show="headings")
+    treeview.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+
+
+# Окно диагностики: счётчики profiler по операциям, экспорт в JSON и cProfile следующей операции
+def diagnostics_window():
+    columns = [
+        ("operation", "Операция", 130), ("calls", "Вызовы", 60), ("seconds", "Всего, с", 70),
+        ("avg", "Среднее, мс", 80), ("max", "Макс., мс", 80), ("read", "Прочитано, КБ", 90),
+        ("written", "Записано, КБ", 90), ("scanned", "Просмотрено строк", 110),
+        ("returned", "Возвращено строк", 110), ("hits", "По индексу", 80), ("scans", "Перебором", 80),
+    ]
+
+    def refresh():
+        treeview.delete(*treeview.get_children())
+        for name, entry in sorted(profiler.snapshot().items()):
+            treeview.insert("", tk.END, values=[
+                name, entry["calls"], f"{entry['seconds']:.3f}", f"{entry['avg_seconds'] * 1000:.2f}",
+                f"{entry['max_seconds'] * 1000:.2f}", entry["bytes_read"] // 1024, entry["bytes_written"] // 1024,
+                entry["rows_scanned"], entry["rows_returned"], entry["index_hits"], entry["scans"],
+            ])
+        profile_text.delete(1.0, tk.END)
+        if profiler.last_profile is not None:
+            profile_text.insert(tk.END, f"{profiler.last_profile['operation']} ({profiler.last_profile['created']})\n")
+            profile_text.insert(tk.END, profiler.last_profile["report"])
+        capture_label.config(text="cProfile включён для следующей операции" if profiler.capture_armed else "")
+
+    def reset():
+        profiler.reset()
+        refresh()
+
+    def export():
+        file_path = asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+        if not file_path:
+            return
+        try:
+            profiler.export(file_path)
+            messagebox.showinfo("Успех", f"Отчёт сохранён в {os.path.basename(file_path)}")
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось очистить базу данных: {e}")
+            messagebox.showerror("Ошибка", f"Не удалось сохранить отчёт: {e}")
+
+    def capture():
+        profiler.capture_next()
+        refresh()
+
+    window = tk.Toplevel(root)
+    window.title("Диагностика")
+    window.geometry("1000x600")
+
+    treeview = ttk.Treeview(window, columns=[column for column, _, _ in columns], show="headings", height=10)
+    for column, title, width in columns:
+        treeview.heading(column, text=title)
+        treeview.column(column, width=width)
+    treeview.pack(fill=tk.X, padx=5, pady=5)
+
+    buttons = tk.Frame(window)
+    buttons.pack(pady=5)
+    tk.Button(buttons, text="Обновить", command=refresh).pack(side=tk.LEFT, padx=5)
+    tk.Button(buttons, text="Сбросить", command=reset).pack(side=tk.LEFT, padx=5)
+    tk.Button(buttons, text="Экспорт в JSON", command=export).pack(side=tk.LEFT, padx=5)
+    tk.Button(buttons, text="Профилировать следующую операцию", command=capture).pack(side=tk.LEFT, padx=5)
+
+    capture_label = tk.Label(window, text="")
+    capture_label.pack()
+    profile_text = tk.Text(window, height=15, font=("Courier", 9))
+    profile_text.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+
+    window.bind("<FocusIn>", lambda event: refresh() if event.widget is window else None)
+    refresh()
+
+
+# Отмена и повтор последнего действия с открытой базой (Ctrl+Z, Ctrl+Y).
+# Большой шаг (очистка, пачка изменений) записывается в фоне, как другие долгие записи
+def undo_change(redo=False):
+    if background_tasks or current_db() is None:
+        return
+    action = "повторить" if redo else "отменить"
+    try:
+        step = db.history.last_undone() if redo else db.history.last_done()
+    except ValueError as e:
+        messagebox.showinfo("Правка", str(e))
+        return
+    if len(step) >= UNDO_BACKGROUND_CHANGES:
+        run_in_background("Повтор изменения" if redo else "Отмена изменения",
+                          lambda task: db.redo() if redo else db.undo(),
+                          lambda result: compact_in_background(), f"Не удалось {action} изменение", cancellable=False)
+        return
+    try:
+        if redo:
+            db.redo()
+        else:
+            db.undo()
+    except Exception as e:
+        messagebox.showerror("Ошибка", f"Не удалось {action} изменение: {e}")
+        return
+    compact_in_background()
 
 
-def open_db_window():
-    global selected_file, indices
-    selected_file = askopenfilename(filetypes=[("JSON files", "*.json")])
-    if not selected_file:
+# Ctrl+Z и Ctrl+Y главного окна; в полях ввода остаются их собственные сочетания
+def undo_key(event, redo=False):
+    if isinstance(event.widget, (tk.Entry, tk.Text, tk.Spinbox, ttk.Entry)):
         return
+    undo_change(redo)
+    return "break"
 
-    fields, data, key_fields = read_db(selected_file)
 
-    if key_fields:
-        indices = create_indices(data, key_fields)  # Создаем индексы
-    else:
-        indices = {}  # Если ключевые поля не заданы, индексы отсутствуют
+def clear_database():
+    if current_db() is None:
+        return
+
+    # Очистка перезаписывает снимок целиком, поэтому идёт в фоне, как сохранение
+    if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите очистить базу данных?"):
+        run_in_background("Очистка базы данных", lambda task: db.clear(),
+                          lambda result: messagebox.showinfo("Успех", "База данных успешно очищена!"),
+                          "Не удалось очистить базу данных", cancellable=False)
+
+
+# Свёртка журнала после изменения из диалога: снимок перезаписывается
+# целиком, поэтому в фоне, а не в главном потоке при записи
+def compact_in_background():
+    if db.needs_compaction():
+        run_in_background("Сжатие журнала", lambda task: db.compact(), lambda result: None,
+                          "Не удалось сжать журнал", cancellable=False)
+
+
+def open_db_window():
+    file_path = askopenfilename(filetypes=DB_FILETYPES)
+    if not file_path:
+        return
+
+    def opened(new_db):
+        global selected_file, db
+        new_db.auto_compact = False
+        db = new_db
+        selected_file = file_path
+        display_db_window()
 
-    display_db_window()
+    # Файл разбирается один раз; первичный индекс читается из .idx
+    # и перестраивается, только если устарел. При отмене открытая ранее база остаётся
+    run_in_background("Загрузка базы", lambda task: database.Database(file_path), opened,
+                      "Не удалось открыть базу данных")
 
 
 
+# Просмотр таблицы с виртуальной прокруткой: в Treeview находятся только
+# видимые строки, остальные подгружаются из открытой базы по позиции
 def display_db_window():
-    if not selected_file:
-        messagebox.showerror("Ошибка", "Сначала выберите файл базы данных!")
+    if current_db() is None:
         return
 
-    fields, data, key_fields = read_db(selected_file)  # Исправлено: распаковываем три значения
+    view_db = db  # Окно остаётся привязанным к базе, открытой в момент вызова
+    fields = view_db.fields
 
-    if not data:
+    if not view_db.has_records():
         messagebox.showinfo("Нет данных", "В базе данных нет записей.")
         return
 
@@ -677,43 +1044,147 @@ def display_db_window():
     db_window.title("Просмотр данных базы")
     db_window.geometry("600x400")
 
-    treeview = ttk.Treeview(db_window, columns=[field["name"] for field in fields], show="headings")
-    for field in fields:
-        treeview.heading(field["name"], text=field["name"])
-        treeview.column(field["name"], width=100)
+    columns = [field["name"] for field in fields]
+    state = {"offset": 0, "visible": VIEW_PAGE_ROWS, "order": None}
 
-    for record in data:
-        treeview.insert("", "end", values=[record.get(field["name"], "") for field in fields])
+    count_label = tk.Label(db_window, anchor="w")
+    count_label.pack(fill="x", side="bottom")
 
+    scrollbar = ttk.Scrollbar(db_window, orient="vertical")
+    scrollbar.pack(side="right", fill="y")
+
+    treeview = ttk.Treeview(db_window, columns=columns, show="headings", selectmode="browse")
+    for name in columns:
+        treeview.heading(name, text=name, command=lambda name=name: sort_by(name))
+        treeview.column(name, width=100)
     treeview.pack(fill="both", expand=True)
 
+    # Щелчок по заголовку: сортировка по возрастанию, повторный — по убыванию.
+    # Перестановка строится один раз (для больших таблиц — в фоне) и кешируется в базе
+    def sort_by(name):
+        descending = state["order"] == (name, False)
+
+        def sorted_ready(result):
+            state["order"] = (name, descending)
+            for column in columns:
+                arrow = (" ▼" if descending else " ▲") if column == name else ""
+                treeview.heading(column, text=column + arrow)
+            scroll_to(0)
+
+        if view_db.count() > SORT_BACKGROUND_ROWS and ("sort", name, descending) not in view_db.cache:
+            run_in_background("Сортировка", lambda task: view_db.sorted_ids(name, descending), sorted_ready,
+                              "Не удалось отсортировать записи")
+        else:
+            sorted_ready(None)
 
+    def render():
+        count = view_db.count()
+        visible = state["visible"]
+        state["offset"] = max(0, min(state["offset"], count - visible))
 
-root = tk.Tk()
-root.title("Менеджер базы данных")
-root.geometry("300x400")
+        treeview.delete(*treeview.get_children())
+        for record in view_db.page(state["offset"], visible, state["order"]):
+            treeview.insert("", "end", values=[record.get(name, "") for name in columns])
 
-selected_file = None
-
-menu = tk.Menu(root)
-root.config(menu=menu)
-
-db_menu = tk.Menu(menu, tearoff=0)
-menu.add_cascade(label="База данных", menu=db_menu)
-db_menu.add_command(label="Создать", command=create_db)
-db_menu.add_command(label="Открыть", command=open_db_window)
-db_menu.add_command(label="Добавить запись", command=add_new_record_dialog)
-db_menu.add_command(label="Удалить", command=delete_db)
-
-tools_menu = tk.Menu(menu, tearoff=0)
-menu.add_cascade(label="Инструменты", menu=tools_menu)
-tools_menu.add_command(label="Импорт из Excel", command=import_from_excel)
-tools_menu.add_command(label="Удалить запись по ключу", command=lambda: delete_record_dialog(selected_file, root))
-tools_menu.add_command(label="Удалить запись по полю", command=delete_record_by_field)
-tools_menu.add_command(label="Поиск по полю", command=search_record_dialog)
-tools_menu.add_command(label="Создать резервную копию", command=create_backup)
-tools_menu.add_command(label="Восстановить из резерва", command=restore_from_backup)
-tools_menu.add_command(label="Редактировать запись", command=edit_record_dialog)
-tools_menu.add_command(label="Очистить базу данных", command=clear_database)
-
-root.mainloop()
+        if count:
+            scrollbar.set(state["offset"] / count, min(1.0, (state["offset"] + visible) / count))
+        else:
+            scrollbar.set(0.0, 1.0)
+        count_label.config(text=f"Записи {state['offset'] + 1}–{min(count, state['offset'] + visible)} из {count}")
+
+    def scroll_to(offset):
+        state["offset"] = offset
+        render()
+
+    # Команды полосы прокрутки: ("moveto", доля) или ("scroll", шаг, "units"/"pages")
+    def on_scrollbar(action, amount, unit=None):
+        if action == "moveto":
+            scroll_to(int(float(amount) * view_db.count()))
+        elif action == "scroll":
+            step = state["visible"] if unit == "pages" else 1
+            scroll_to(state["offset"] + int(amount) * step)
+
+    def on_wheel(event):
+        if getattr(event, "num", None) == 4 or event.delta > 0:
+            scroll_to(state["offset"] - 3)
+        else:
+            scroll_to(state["offset"] + 3)
+        return "break"
+
+    # Количество строк на экране зависит от высоты окна
+    def on_resize(event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible = max(1, event.height // row_height - 1)
+        if visible != state["visible"]:
+            state["visible"] = visible
+            render()
+
+    # Базу могли изменить в других окнах или снаружи
+    def on_focus(event):
+        try:
+            view_db.refresh()
+        except Exception:
+            return
+        render()
+
+    scrollbar.config(command=on_scrollbar)
+    treeview.bind("<MouseWheel>", on_wheel)
+    treeview.bind("<Button-4>", on_wheel)
+    treeview.bind("<Button-5>", on_wheel)
+    treeview.bind("<Configure>", on_resize)
+    treeview.bind("<Prior>", lambda event: scroll_to(state["offset"] - state["visible"]))
+    treeview.bind("<Next>", lambda event: scroll_to(state["offset"] + state["visible"]))
+    treeview.bind("<Home>", lambda event: scroll_to(0))
+    treeview.bind("<End>", lambda event: scroll_to(view_db.count()))
+    db_window.bind("<FocusIn>", on_focus)
+
+    render()
+
+
+# Создание главного окна и меню и запуск программы
+def main_window():
+    global root
+
+    root = tk.Tk()
+    root.title("Менеджер базы данных")
+    root.geometry("300x400")
+
+    menu = tk.Menu(root)
+    root.config(menu=menu)
+
+    db_menu = tk.Menu(menu, tearoff=0)
+    menu.add_cascade(label="База данных", menu=db_menu)
+    db_menu.add_command(label="Создать", command=create_db)
+    db_menu.add_command(label="Открыть", command=open_db_window)
+    db_menu.add_command(label="Добавить запись", command=add_new_record_dialog)
+    db_menu.add_command(label="Удалить", command=delete_db)
+
+    edit_menu = tk.Menu(menu, tearoff=0)
+    menu.add_cascade(label="Правка", menu=edit_menu)
+    edit_menu.add_command(label="Отменить", accelerator="Ctrl+Z", command=undo_change)
+    edit_menu.add_command(label="Повторить", accelerator="Ctrl+Y", command=lambda: undo_change(redo=True))
+    root.bind("<Control-z>", undo_key)
+    root.bind("<Control-y>", lambda event: undo_key(event, redo=True))
+
+    tools_menu = tk.Menu(menu, tearoff=0)
+    menu.add_cascade(label="Инструменты", menu=tools_menu)
+    tools_menu.add_command(label="Импорт из Excel/CSV", command=import_from_excel)
+    tools_menu.add_command(label="Конвертировать базу", command=convert_db)
+    tools_menu.add_command(label="Экспорт в CSV/Excel/JSON Lines", command=export_records)
+    tools_menu.add_command(label="Удалить запись по ключу", command=lambda: delete_record_dialog(selected_file, root))
+    tools_menu.add_command(label="Удалить запись по полю", command=delete_record_by_field)
+    tools_menu.add_command(label="Поиск по полю", command=search_record_dialog)
+    tools_menu.add_command(label="Запрос", command=query_dialog)
+    tools_menu.add_command(label="Группировка и итоги", command=aggregate_dialog)
+    tools_menu.add_command(label="Индексы полей", command=indexes_dialog)
+    tools_menu.add_command(label="Создать резервную копию", command=create_backup)
+    tools_menu.add_command(label="Восстановить из резерва", command=restore_from_backup)
+    tools_menu.add_command(label="Редактировать запись", command=edit_record_dialog)
+    tools_menu.add_command(label="Очистить базу данных", command=clear_database)
+    tools_menu.add_command(label="Диагностика", command=diagnostics_window)
+
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main_window()
@@ -0,0 +1,160 @@
+import json
+import os
+import sys
+
+import packed
+import storage
+
+# История изменений для отмены и повтора. Шаг истории — одно действие
+# пользователя (добавление, правка, удаление, очистка, пачка изменений) в виде
+# пар образов строки (до, после): None до — строка добавлена, None после — удалена.
+# Отмена и повтор записываются в журнал базы как обычные изменения, поэтому
+# стоят столько, сколько строк затронул шаг, а не сколько строк в базе.
+# Строки неизменяемы (packed.Record), поэтому образы в памяти — ссылки на те же
+# строки, а не копии. История ограничена MAX_BYTES: старые шаги отбрасываются.
+# Если PERSIST включён, история дописывается в <файл>.history (JSON Lines):
+#   {"op": "do", "changes": [[до, после], ...], "stamp": ...}, {"op": "undo", ...}, {"op": "redo", ...}.
+# stamp — отпечаток базы после действия; если базу потом меняли без истории, файл не загружается
+HISTORY_SUFFIX = ".history"
+MAX_BYTES = 128 * 1024 * 1024
+PERSIST = False
+
+
+def history_path(file_path):
+    return file_path + HISTORY_SUFFIX
+
+
+# Примерный размер шага в памяти: сами образы строк без общих с базой значений
+def step_size(changes):
+    return sys.getsizeof(changes) + sum(
+        sys.getsizeof(pair) + sum(sys.getsizeof(image) for image in pair if image is not None)
+        for pair in changes
+    )
+
+
+# Изменения журнала, отменяющие шаг (в обратном порядке)
+def undo_entries(changes, key_fields):
+    entries = []
+    for old, new in reversed(changes):
+        if old is None:
+            entries.append(storage.delete_entry(storage.record_key(new, key_fields)))
+        elif new is None:
+            entries.append(storage.add_entry(old))
+        else:
+            entries.append(storage.edit_entry(storage.record_key(new, key_fields), old))
+    return entries
+
+
+# Изменения журнала, повторяющие шаг
+def redo_entries(changes, key_fields):
+    entries = []
+    for old, new in changes:
+        if old is None:
+            entries.append(storage.add_entry(new))
+        elif new is None:
+            entries.append(storage.delete_entry(storage.record_key(old, key_fields)))
+        else:
+            entries.append(storage.edit_entry(storage.record_key(old, key_fields), new))
+    return entries
+
+
+class History:
+    def __init__(self, file_path, persist=None):
+        self.file_path = file_path
+        self.persist = PERSIST if persist is None else persist
+        self.undo_steps = []
+        self.redo_steps = []
+        self.size = 0
+
+    def can_undo(self):
+        return bool(self.undo_steps)
+
+    def can_redo(self):
+        return bool(self.redo_steps)
+
+    # Шаги из файла истории, если он относится к текущему состоянию базы
+    def load(self, stamp):
+        path = history_path(self.file_path)
+        if not self.persist or not os.path.exists(path):
+            return
+        last_stamp = None
+        with open(path, "r", encoding="utf-8") as history_file:
+            for line in history_file:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if item["op"] == "do":
+                    self.add_step(item["changes"])
+                elif item["op"] == "undo" and self.undo_steps:
+                    self.redo_steps.append(self.undo_steps.pop())
+                elif item["op"] == "redo" and self.redo_steps:
+                    self.undo_steps.append(self.redo_steps.pop())
+                last_stamp = item["stamp"]
+        if last_stamp != stamp:
+            self.clear()
+
+    # Шаги хранятся парами (изменения, размер); size — размер обоих стеков
+    def add_step(self, changes):
+        self.size -= sum(size for _, size in self.redo_steps)
+        self.redo_steps = []
+        self.undo_steps.append((changes, step_size(changes)))
+        self.size += self.undo_steps[-1][1]
+        while self.undo_steps and self.size > MAX_BYTES:
+            self.size -= self.undo_steps.pop(0)[1]
+
+    # Новый шаг после изменения базы (stamp — отпечаток базы после него)
+    def push(self, changes, stamp):
+        dropped = len(self.undo_steps) + 1
+        self.add_step(changes)
+        dropped -= len(self.undo_steps)
+        if not self.persist:
+            return
+        if dropped:
+            self.save(stamp)
+        else:
+            self.append({"op": "do", "changes": [[packed.unpack(old), packed.unpack(new)] for old, new in changes], "stamp": stamp})
+
+    # Шаг, который отменит undo (сама история меняется в undone после записи в базу)
+    def last_done(self):
+        if not self.undo_steps:
+            raise ValueError("Нечего отменять")
+        return self.undo_steps[-1][0]
+
+    def last_undone(self):
+        if not self.redo_steps:
+            raise ValueError("Нечего повторять")
+        return self.redo_steps[-1][0]
+
+    def undone(self, stamp):
+        self.redo_steps.append(self.undo_steps.pop())
+        if self.persist:
+            self.append({"op": "undo", "stamp": stamp})
+
+    def redone(self, stamp):
+        self.undo_steps.append(self.redo_steps.pop())
+        if self.persist:
+            self.append({"op": "redo", "stamp": stamp})
+
+    def append(self, item):
+        with open(history_path(self.file_path), "a", encoding="utf-8") as history_file:
+            history_file.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    # Перезапись файла истории целиком (после того как старые шаги отброшены)
+    def save(self, stamp):
+        steps = self.undo_steps + self.redo_steps[::-1]
+        def write(temp_path):
+            with open(temp_path, "w", encoding="utf-8") as history_file:
+                for changes, _ in steps:
+                    item = {"op": "do", "changes": [[packed.unpack(old), packed.unpack(new)] for old, new in changes], "stamp": stamp}
+                    history_file.write(json.dumps(item, ensure_ascii=False) + "\n")
+                for _ in self.redo_steps:
+                    history_file.write(json.dumps({"op": "undo", "stamp": stamp}) + "\n")
+        storage.write_atomic(history_path(self.file_path), write)
+
+    def clear(self):
+        self.undo_steps = []
+        self.redo_steps = []
+        self.size = 0
+        if self.persist and os.path.exists(history_path(self.file_path)):
+            os.remove(history_path(self.file_path))
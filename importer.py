@@ -0,0 +1,180 @@
+import os
+
+import pandas as pd
+
+import storage
+import profiler
+
+# Сколько строк читается и обрабатывается за раз
+CHUNK_ROWS = 50000
+
+# Порядок расширения типов: столбец с int и float становится float, с числами и текстом — str
+TYPE_ORDER = ["int", "float", "str"]
+
+
+def is_csv(file_path):
+    return file_path.lower().endswith(".csv")
+
+
+# Чтение таблицы кусками по chunk_rows строк. Все значения читаются как есть,
+# типы определяются отдельно, поэтому разные куски не расходятся в типах
+def iter_chunks(file_path, chunk_rows=CHUNK_ROWS):
+    if is_csv(file_path):
+        yield from pd.read_csv(file_path, chunksize=chunk_rows, dtype=object)
+        return
+
+    # У read_excel нет чтения по частям, поэтому лист читается построчно через openpyxl
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) for name in header]
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_rows:
+                yield pd.DataFrame(chunk, columns=columns, dtype=object)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+
+# Тип одного столбца куска: None, если в нём только пустые значения
+def infer_type(series):
+    values = series.dropna()
+    if values.empty:
+        return None
+    numbers = pd.to_numeric(values, errors="coerce")
+    if numbers.isna().any():
+        return "str"
+    if pd.api.types.is_integer_dtype(numbers):
+        return "int"
+    return "float"
+
+
+def wider_type(first, second):
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return max(first, second, key=TYPE_ORDER.index)
+
+
+# Первый проход: типы столбцов по всему файлу и число строк.
+# progress(прочитано строк, всего) вызывается после каждого куска; всего на этом проходе неизвестно
+def infer_fields(file_path, chunk_rows=CHUNK_ROWS, progress=None):
+    types = {}
+    rows = 0
+    for chunk in iter_chunks(file_path, chunk_rows):
+        for name in chunk.columns:
+            types[name] = wider_type(types.get(name), infer_type(chunk[name]))
+        rows += len(chunk)
+        if progress is not None:
+            progress(rows, None)
+    return [{"name": name, "type": field_type or "str"} for name, field_type in types.items()], rows
+
+
+# Значения столбца, приведённые к типу схемы; пустые значения становятся None
+def convert_column(series, field_type):
+    empty = series.isna().tolist()
+    if field_type == "str":
+        values = series.astype(str).tolist()
+    else:
+        numbers = pd.to_numeric(series, errors="coerce")
+        bad = numbers.isna() & series.notna()
+        if bad.any():
+            raise ValueError(f"Значение {series[bad].iloc[0]!r} поля '{series.name}' не является {field_type}")
+        if field_type == "int":
+            if (numbers.dropna() % 1 != 0).any():
+                raise ValueError(f"Поле '{series.name}' содержит дробные значения, ожидается int")
+            values = [0 if is_empty else int(value) for value, is_empty in zip(numbers.tolist(), empty)]
+        else:
+            values = [float(value) for value in numbers.tolist()]
+    return [None if is_empty else value for value, is_empty in zip(values, empty)]
+
+
+# Второй проход: записи по кускам, с проверкой уникальности ключа за один проход по хешу
+def iter_records(file_path, fields, key_fields, seen_keys, chunk_rows=CHUNK_ROWS, progress=None, total=None):
+    names = [field["name"] for field in fields]
+    done = 0
+    for chunk in iter_chunks(file_path, chunk_rows):
+        if progress is not None:
+            progress(done, total)
+        done += len(chunk)
+        missing = [name for name in names if name not in chunk.columns]
+        if missing:
+            raise ValueError(f"В файле нет столбцов: {', '.join(missing)}")
+
+        columns = [convert_column(chunk[field["name"]], field["type"]) for field in fields]
+        for values in zip(*columns):
+            record = dict(zip(names, values))
+            if key_fields:
+                key = storage.record_key(record, key_fields)
+                if any(value is None for value in key):
+                    raise ValueError(f"Пустое значение ключевого поля в записи {record}")
+                if key in seen_keys:
+                    raise ValueError(f"Дублирование ключа: {key}")
+                seen_keys.add(key)
+            yield record
+
+
+# Импорт в новую базу. Формат задаётся расширением целевого файла; JSON и
+# JSON Lines пишутся потоком. Запись атомарная (storage.write_atomic), поэтому
+# исключение из progress (например, отмена) оставляет целевой файл нетронутым
+@profiler.timed("import")
+def import_new(source_path, target_path, key_fields, chunk_rows=CHUNK_ROWS, progress=None):
+    fields, total = infer_fields(source_path, chunk_rows, progress)
+    unknown = [name for name in key_fields if name not in [field["name"] for field in fields]]
+    if unknown:
+        raise ValueError(f"Ключевые поля отсутствуют в файле: {', '.join(unknown)}")
+
+    records = iter_records(source_path, fields, key_fields, set(), chunk_rows, progress, total)
+    storage.replace_snapshot(target_path, lambda temp_path: storage.write_file(temp_path, fields, records, key_fields))
+    profiler.count("import", bytes_read=storage.file_size(source_path), bytes_written=storage.file_size(target_path), rows_scanned=total)
+    return fields
+
+
+# Импорт в существующую базу: типы берутся из её схемы, уникальность проверяется
+# по первичному индексу, записи дописываются в журнал пачками по chunk_rows
+@profiler.timed("import")
+def import_append(source_path, target_path, chunk_rows=CHUNK_ROWS, progress=None):
+    fields, key_fields = storage.read_header(target_path)
+    if not key_fields:
+        raise ValueError("Ключевые поля не указаны!")
+
+    index, next_row = storage.index_state(target_path)
+    seen_keys = set(index)
+
+    # Размеры журнала и индекса до импорта: при ошибке они обрезаются обратно,
+    # и база остаётся такой, какой была
+    storage.repair_log(target_path)
+    saved = [(path, storage.file_size(path)) for path in (storage.log_path(target_path), storage.index_path(target_path))]
+
+    batch = []
+    count = 0
+    try:
+        for record in iter_records(source_path, fields, key_fields, seen_keys, chunk_rows, progress):
+            batch.append(record)
+            if len(batch) == chunk_rows:
+                next_row = storage.log_adds(target_path, batch, key_fields, index, next_row)
+                count += len(batch)
+                batch = []
+        if batch:
+            storage.log_adds(target_path, batch, key_fields, index, next_row)
+            count += len(batch)
+    except Exception:
+        for path, size in saved:
+            if os.path.exists(path):
+                with open(path, "r+b") as file:
+                    file.truncate(size)
+        raise
+
+    storage.compact_if_needed(target_path)
+    profiler.count("import", bytes_read=storage.file_size(source_path), rows_scanned=count)
+    return count
@@ -0,0 +1,413 @@
+import bisect
+from array import array
+from itertools import compress, count
+
+import packed
+import profiler
+
+# Виды вторичных индексов, которые можно объявить в схеме:
+# {"name": "age", "type": "int", "index": "sorted"}
+# hash — для любых полей, sorted — для int и float, ngram и prefix — для str
+INDEX_KINDS = ["hash", "sorted", "ngram", "prefix"]
+KIND_TYPES = {"sorted": ("int", "float"), "ngram": ("str",), "prefix": ("str",)}
+
+# Операции сравнения для поиска; contains — подстрока, startswith — начало строки
+OPERATORS = ["=", ">", "<", ">=", "<=", "between", "contains", "startswith"]
+
+# Длина n-граммы для индекса подстрок
+NGRAM = 3
+# Символ больше любого другого: верхняя граница диапазона строк с общим префиксом
+MAX_CHAR = chr(0x10FFFF)
+
+# Сколько первых значений проверяется на повторы перед построением хеш-индекса как уникального
+UNIQUE_SAMPLE = 1000
+
+
+# Хеш-индекс: значение поля -> номер строки, а если строк с этим значением
+# несколько — упорядоченный массив номеров (array, 8 байт на строку вместо
+# элемента множества и объекта числа). Для уникальных полей это экономит
+# по отдельному массиву на каждую строку
+class HashIndex:
+    kind = "hash"
+
+    def __init__(self, field):
+        self.field = field
+        self.buckets = {}
+
+    # Построение по столбцу values (alive — признаки живых строк). Если значения
+    # повторяются, индекс заполняется построчно через insert в общем цикле
+    # TableIndexes.build, и тогда возвращается False
+    def build(self, values, alive):
+        # Все значения разные (ключевое поле): словарь собирается без цикла на Python.
+        # Если повторы видны уже среди первых строк, эта попытка пропускается
+        sample = values[:UNIQUE_SAMPLE]
+        if len(set(sample)) == len(sample):
+            self.buckets = dict(zip(compress(values, alive), compress(count(), alive)))
+            if len(self.buckets) == sum(alive):
+                return True
+        self.buckets = {}
+        return False
+
+    def add(self, row, record):
+        self.insert(row, record.get(self.field))
+
+    # Строки обычно добавляются в конец (номера растут), поэтому вставка в массив —
+    # это append, а не сдвиг
+    def insert(self, row, value):
+        bucket = self.buckets.get(value)
+        if bucket is None:
+            self.buckets[value] = row
+        elif type(bucket) is array:
+            if bucket[-1] < row:
+                bucket.append(row)
+                return
+            position = bisect.bisect_left(bucket, row)
+            if bucket[position] != row:
+                bucket.insert(position, row)
+        elif bucket != row:
+            self.buckets[value] = array("q", sorted((bucket, row)))
+
+    def remove(self, row, record):
+        value = record.get(self.field)
+        bucket = self.buckets.get(value)
+        if type(bucket) is array:
+            position = bisect.bisect_left(bucket, row)
+            if position < len(bucket) and bucket[position] == row:
+                del bucket[position]
+            if len(bucket) == 1:
+                self.buckets[value] = bucket[0]
+        elif bucket == row:
+            del self.buckets[value]
+
+    def rows_of(self, value):
+        bucket = self.buckets.get(value)
+        if bucket is None:
+            return []
+        return list(bucket) if type(bucket) is array else [bucket]
+
+    def search(self, op, value, upper=None):
+        if op != "=":
+            return None  # Хеш-индекс подходит только для равенства
+        return self.rows_of(value)
+
+    # Сколько строк вернёт search, без построения списка (для планировщика запросов)
+    def estimate(self, op, value, upper=None):
+        if op != "=":
+            return None
+        bucket = self.buckets.get(value)
+        if bucket is None:
+            return 0
+        return len(bucket) if type(bucket) is array else 1
+
+
+# Индекс единственного ключевого поля: своего словаря нет, строки ищутся в
+# первичном индексе базы (составной ключ из одного значения -> номер строки).
+# Первичный индекс обновляется при записи журнала, поэтому add и remove ничего не делают
+class KeyIndex:
+    kind = "hash"
+
+    def __init__(self, field, primary_index):
+        self.field = field
+        self.primary_index = primary_index
+
+    def build(self, values, alive):
+        return True
+
+    def add(self, row, record):
+        pass
+
+    def remove(self, row, record):
+        pass
+
+    def rows_of(self, value):
+        row = self.primary_index.get((value,))
+        return [] if row is None else [row]
+
+    def search(self, op, value, upper=None):
+        if op != "=":
+            return None
+        return self.rows_of(value)
+
+    def estimate(self, op, value, upper=None):
+        if op != "=":
+            return None
+        return len(self.rows_of(value))
+
+
+# Отсортированный индекс для полей int и float: параллельные списки значений
+# и номеров строк, упорядоченные по значению. Диапазон ищется бинарным поиском
+# за O(log n + k). Номера строк, а для столбца-массива и значения, хранятся в array
+class SortedIndex:
+    kind = "sorted"
+
+    # Какие значения попадают в индекс
+    @staticmethod
+    def accepts(value):
+        return is_number(value)
+
+    def __init__(self, field):
+        self.field = field
+        self.values = []
+        self.rows = []
+
+    # Сортировка номеров строк по списку значений: ключ — метод списка, без
+    # Python-функции на каждое сравнение; равные значения остаются в порядке строк
+    # Значения удалённых строк — None, их accepts не пропускает
+    def build(self, values, alive):
+        self.rows = array("q", sorted(compress(count(), map(self.accepts, values)), key=values.__getitem__))
+        ordered = map(values.__getitem__, self.rows)
+        self.values = array(values.typecode, ordered) if isinstance(values, array) else list(ordered)
+        return True
+
+    def add(self, row, record):
+        value = record.get(self.field)
+        if not self.accepts(value):
+            return
+        if not packed.fits(self.values, value):
+            self.values = list(self.values)
+        position = bisect.bisect_right(self.values, value)
+        self.values.insert(position, value)
+        self.rows.insert(position, row)
+
+    def remove(self, row, record):
+        value = record.get(self.field)
+        if not self.accepts(value):
+            return
+        low = bisect.bisect_left(self.values, value)
+        high = bisect.bisect_right(self.values, value)
+        try:
+            position = self.rows.index(row, low, high)
+        except ValueError:
+            return
+        del self.values[position]
+        del self.rows[position]
+
+    # Границы среза values для диапазона
+    def bounds(self, low=None, high=None, include_low=True, include_high=True):
+        if low is None:
+            start = 0
+        elif include_low:
+            start = bisect.bisect_left(self.values, low)
+        else:
+            start = bisect.bisect_right(self.values, low)
+
+        if high is None:
+            end = len(self.values)
+        elif include_high:
+            end = bisect.bisect_right(self.values, high)
+        else:
+            end = bisect.bisect_left(self.values, high)
+
+        return start, max(start, end)
+
+    def range(self, low=None, high=None, include_low=True, include_high=True):
+        start, end = self.bounds(low, high, include_low, include_high)
+        return self.rows[start:end]
+
+    # Диапазон для операции сравнения или None, если операция не поддерживается
+    def op_range(self, op, value, upper=None):
+        if not self.accepts(value) or (op == "between" and not self.accepts(upper)):
+            return None
+        if op == "=":
+            return value, value, True, True
+        if op == ">":
+            return value, None, False, True
+        if op == ">=":
+            return value, None, True, True
+        if op == "<":
+            return None, value, True, False
+        if op == "<=":
+            return None, value, True, True
+        if op == "between":
+            return value, upper, True, True
+        return None
+
+    def search(self, op, value, upper=None):
+        arguments = self.op_range(op, value, upper)
+        if arguments is None:
+            return None
+        return sorted(self.range(*arguments))
+
+    def estimate(self, op, value, upper=None):
+        arguments = self.op_range(op, value, upper)
+        if arguments is None:
+            return None
+        start, end = self.bounds(*arguments)
+        return end - start
+
+
+# Отсортированный индекс строк: те же диапазоны, что у SortedIndex, плюс поиск
+# по началу строки — все строки с префиксом p лежат подряд между p и p + MAX_CHAR
+class PrefixIndex(SortedIndex):
+    kind = "prefix"
+
+    @staticmethod
+    def accepts(value):
+        return isinstance(value, str)
+
+    def op_range(self, op, value, upper=None):
+        if op == "startswith":
+            return (value, value + MAX_CHAR, True, False) if self.accepts(value) else None
+        return super().op_range(op, value, upper)
+
+
+def ngrams(value):
+    return {value[i:i + NGRAM] for i in range(len(value) - NGRAM + 1)}
+
+
+# Инвертированный индекс n-грамм для поиска подстроки: n-грамма -> множество строк.
+# Кандидаты — пересечение множеств всех n-грамм образца (начиная с самого
+# короткого), затем каждый проверяется по самому значению. Образцы короче NGRAM
+# индекс не обслуживает — для них будет перебор
+class TrigramIndex:
+    kind = "ngram"
+
+    def __init__(self, field):
+        self.field = field
+        self.grams = {}
+        self.values = {}
+
+    # Заполняется построчно через insert в общем цикле TableIndexes.build
+    def build(self, values, alive):
+        self.grams = {}
+        self.values = {}
+        return False
+
+    def add(self, row, record):
+        self.insert(row, record.get(self.field))
+
+    def insert(self, row, value):
+        if not isinstance(value, str):
+            return
+        self.values[row] = value
+        grams = self.grams
+        for gram in ngrams(value):
+            bucket = grams.get(gram)
+            if bucket is None:
+                grams[gram] = {row}
+            else:
+                bucket.add(row)
+
+    def remove(self, row, record):
+        value = self.values.pop(row, None)
+        if value is None:
+            return
+        for gram in ngrams(value):
+            bucket = self.grams.get(gram)
+            if bucket is not None:
+                bucket.discard(row)
+                if not bucket:
+                    del self.grams[gram]
+
+    # Множества строк для n-грамм образца, от самого маленького, или None
+    def postings(self, op, value):
+        if op not in ("contains", "startswith", "=") or not isinstance(value, str) or len(value) < NGRAM:
+            return None
+        return sorted((self.grams.get(gram, set()) for gram in ngrams(value)), key=len)
+
+    def search(self, op, value, upper=None):
+        postings = self.postings(op, value)
+        if postings is None:
+            return None
+        candidates = postings[0].intersection(*postings[1:])
+        return sorted(row for row in candidates if matches(self.values[row], op, value))
+
+    # Оценка сверху: размер самого маленького множества
+    def estimate(self, op, value, upper=None):
+        postings = self.postings(op, value)
+        return None if postings is None else len(postings[0])
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+INDEX_CLASSES = {"hash": HashIndex, "sorted": SortedIndex, "ngram": TrigramIndex, "prefix": PrefixIndex}
+
+
+# Проверка одного значения при полном переборе
+def matches(value, op, operand, upper=None):
+    try:
+        if op == "=":
+            return value == operand
+        if op == ">":
+            return value > operand
+        if op == "<":
+            return value < operand
+        if op == ">=":
+            return value >= operand
+        if op == "<=":
+            return value <= operand
+        if op == "between":
+            return operand <= value <= upper
+        if op == "contains":
+            return isinstance(value, str) and operand in value
+        if op == "startswith":
+            return isinstance(value, str) and value.startswith(operand)
+    except TypeError:
+        return False  # Значение другого типа (например, строка в числовом поле)
+    raise ValueError(f"Неизвестная операция: {op}")
+
+
+# Набор вторичных индексов таблицы. Индексы объявляются в схеме полей,
+# ключевые поля индексируются хеш-индексом всегда
+class TableIndexes:
+    def __init__(self, fields, key_fields=()):
+        self.key_fields = list(key_fields)
+        self.indexes = {}
+        for field in fields:
+            kind = field.get("index")
+            if kind is None and field["name"] in key_fields:
+                kind = "hash"
+            if kind is not None:
+                if kind not in INDEX_CLASSES:
+                    raise ValueError(f"Неизвестный вид индекса '{kind}' у поля {field['name']}")
+                if kind in KIND_TYPES and field["type"] not in KIND_TYPES[kind]:
+                    types = " и ".join(KIND_TYPES[kind])
+                    raise ValueError(f"Индекс {kind} возможен только для полей {types}: {field['name']}")
+                self.indexes[field["name"]] = INDEX_CLASSES[kind](field["name"])
+
+    # Все индексы строятся за один проход по строкам: столбцы всех индексируемых
+    # полей извлекаются вместе, затем индексы, которые собираются без цикла на
+    # Python (уникальный hash, sorted, prefix), строятся по своим столбцам, а
+    # остальные (hash с повторами, ngram) заполняются в одном общем цикле.
+    # primary_index — уже построенный первичный индекс (составной ключ -> строка):
+    # хеш-индекс единственного ключевого поля заменяется видом на него (KeyIndex)
+    @profiler.timed("index_build")
+    def build(self, rows, primary_index=None):
+        if primary_index is not None and len(self.key_fields) == 1 and isinstance(self.indexes.get(self.key_fields[0]), HashIndex):
+            self.indexes[self.key_fields[0]] = KeyIndex(self.key_fields[0], primary_index)
+        pending = {name: index for name, index in self.indexes.items() if not isinstance(index, KeyIndex)}
+        alive = packed.alive(rows)
+        columns = packed.columns(rows, list(pending))
+        looped = [name for name, index in pending.items() if not index.build(columns[name], alive)]
+        inserts = [pending[name].insert for name in looped]
+        for row, values in compress(enumerate(zip(*[columns[name] for name in looped])), alive):
+            for insert, value in zip(inserts, values):
+                insert(row, value)
+        profiler.count("index_build", rows_scanned=len(rows))
+
+    # Обработчик изменения строки: old — запись до изменения, new — после (None, если нет)
+    def update(self, row, old, new):
+        for index in self.indexes.values():
+            if old is not None:
+                index.remove(row, old)
+            if new is not None:
+                index.add(row, new)
+
+    # Номера строк, подходящих под условие: по индексу, если он подходит, иначе перебором
+    @profiler.timed("search")
+    def search(self, rows, field, op, value, upper=None):
+        index = self.indexes.get(field)
+        if index is not None:
+            found = index.search(op, value, upper)
+            if found is not None:
+                profiler.count("search", index_hits=1, rows_returned=len(found))
+                return found
+        found = [
+            row for row, current in enumerate(packed.column(rows, field))
+            if matches(current, op, value, upper) and rows[row] is not None
+        ]
+        profiler.count("search", scans=1, rows_scanned=len(rows), rows_returned=len(found))
+        return found
+
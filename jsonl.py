@@ -0,0 +1,73 @@
+import json
+
+# Формат JSON Lines: первая строка — заголовок
+#   {"format": "jsonl", "fields": [...], "key_fields": [...]},
+# далее по одной записи на строку. Записи читаются по одной, без загрузки всего файла
+EXTENSION = ".jsonl"
+
+
+def is_jsonl(file_path):
+    return file_path.lower().endswith(EXTENSION)
+
+
+def read_header(file_path):
+    with open(file_path, "r", encoding="utf-8") as db_file:
+        header = json.loads(db_file.readline())
+    if header.get("format") != "jsonl":
+        raise ValueError("Файл не является базой в формате JSON Lines!")
+    return header.get("fields", []), header.get("key_fields", [])
+
+
+# Записи по одной; память не зависит от размера файла
+def iter_jsonl(file_path):
+    with open(file_path, "r", encoding="utf-8") as db_file:
+        db_file.readline()  # Заголовок
+        for line in db_file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_jsonl(file_path):
+    fields, key_fields = read_header(file_path)
+    return fields, list(iter_jsonl(file_path)), key_fields
+
+
+# Строки файла JSON Lines: заголовок, затем записи
+def jsonl_lines(fields, data, key_fields=None):
+    header = {"format": "jsonl", "fields": fields}
+    if key_fields is not None:
+        header["key_fields"] = key_fields
+    yield json.dumps(header, ensure_ascii=False) + "\n"
+    for record in data:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+# Запись базы; data может быть любым итерируемым объектом (например, генератором)
+def write_jsonl(file_path, fields, data, key_fields=None):
+    with open(file_path, "w", encoding="utf-8") as db_file:
+        db_file.writelines(jsonl_lines(fields, data, key_fields))
+
+
+# Потоковая запись в обычном формате JSON (с отступами, как у write_snapshot):
+# записи выводятся по одной, весь документ в памяти не собирается
+def write_json_stream(file_path, fields, data, key_fields=None):
+    with open(file_path, "w", encoding="utf-8") as db_file:
+        db_file.write('{\n    "fields": ')
+        db_file.write(indent_json(fields))
+        if key_fields is not None:
+            db_file.write(',\n    "key_fields": ')
+            db_file.write(indent_json(key_fields))
+        db_file.write(',\n    "data": [')
+
+        first = True
+        for record in data:
+            db_file.write("\n        " if first else ",\n        ")
+            db_file.write(json.dumps(record, indent=4, ensure_ascii=False).replace("\n", "\n        "))
+            first = False
+
+        db_file.write("]\n}" if first else "\n    ]\n}")
+
+
+def indent_json(value):
+    return json.dumps(value, indent=4, ensure_ascii=False).replace("\n", "\n    ")
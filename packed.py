@@ -0,0 +1,312 @@
+import sys
+from array import array
+from itertools import repeat
+from operator import itemgetter
+
+# Компактное представление строки в памяти. Словарь на каждую запись хранит
+# свою хеш-таблицу ключей, а для JSON Lines — ещё и свои копии имён полей.
+# Record — это кортеж значений в порядке полей; имена полей и их позиции
+# хранятся один раз в классе, общем для всех строк с одинаковым набором полей.
+# Снаружи строка ведёт себя как словарь только для чтения: record["имя"],
+# record.get("имя"), keys(), items(), dict(record), сравнение со словарём.
+# Повторяющиеся короткие строковые значения (город, категория) хранятся в одном
+# экземпляре на всю таблицу.
+# Загруженная таблица (Table) хранит строки не кортежами, а по столбцам: поля, в
+# которых все значения int или все float, лежат в типизированных массивах
+# (array, 8 байт на значение вместо отдельного объекта Python), остальные — в
+# списках. Record собирается из столбцов при обращении к строке, поэтому чтение
+# одной строки дороже, чем взятие готового кортежа; много строк сразу — take
+INTERN_MAX = 64
+# Типы array для столбцов: код -> тип значений (bool в столбец int не попадает)
+TYPECODES = {"q": int, "d": float}
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+types = {}
+
+
+class Record(tuple):
+    __slots__ = ()
+    names = ()
+    positions = {}
+
+    def __getitem__(self, name):
+        return tuple.__getitem__(self, self.positions[name])
+
+    def get(self, name, default=None):
+        position = self.positions.get(name)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def keys(self):
+        return self.names
+
+    def values(self):
+        return tuple(tuple.__iter__(self))
+
+    def items(self):
+        return zip(self.names, tuple.__iter__(self))
+
+    def to_dict(self):
+        return dict(zip(self.names, tuple.__iter__(self)))
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    # Как и словарь, строка не хешируется
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    # Классы строк создаются на лету, поэтому для pickle строка описывается именами и значениями
+    def __reduce__(self):
+        return make, (self.names, self.values())
+
+
+# Класс строк для набора полей names (создаётся один раз на набор)
+def record_type(names):
+    cls = types.get(names)
+    if cls is None:
+        positions = {name: position for position, name in enumerate(names)}
+        cls = types[names] = type("Record", (Record,), {"__slots__": (), "names": names, "positions": positions})
+    return cls
+
+
+def make(names, values):
+    return record_type(names)(values)
+
+
+def compact_value(value):
+    if type(value) is str and len(value) <= INTERN_MAX:
+        return sys.intern(value)
+    return value
+
+
+# Словарь -> Record (None и уже упакованные строки возвращаются как есть)
+def pack(record):
+    if record is None or isinstance(record, Record):
+        return record
+    return record_type(tuple(record))(map(compact_value, record.values()))
+
+
+# Помещается ли значение в столбец, не меняя типа (в массив — только значения его типа)
+def fits(column, value):
+    if type(column) is not array:
+        return True
+    if type(value) is not TYPECODES[column.typecode]:
+        return False
+    return column.typecode == "d" or INT_MIN <= value <= INT_MAX
+
+
+# Столбец из значений: массив, если все значения одного числового типа, иначе список
+def typed_column(values):
+    kinds = set(map(type, values))
+    for typecode, kind in TYPECODES.items():
+        if kinds == {kind}:
+            try:
+                return array(typecode, values)
+            except OverflowError:
+                break
+    return list(values)
+
+
+# Строки таблицы по столбцам. Набор полей names — общий для почти всех строк;
+# удалённые строки (None) и строки с другим набором полей лежат в others
+# (номер строки -> запись), а в столбцах на их месте остаются значения-заполнители.
+# Снаружи таблица ведёт себя как список строк: len, [номер], присваивание,
+# append, перебор, count(None). Значение, которое не помещается в массив
+# (другой тип, None, слишком большое число), переводит столбец в список
+class Table:
+    def __init__(self, names=(), columns=(), others=None, length=0):
+        self.names = names
+        self.cls = record_type(names)
+        self.columns = list(columns)
+        self.others = others if others is not None else {}
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, row):
+        if type(row) is slice:
+            return self.take(range(*row.indices(self.length)))
+        if row < 0:
+            row += self.length
+        if self.others and row in self.others:
+            return self.others[row]
+        if not 0 <= row < self.length:
+            raise IndexError("Номер строки вне таблицы")
+        return self.cls([column[row] for column in self.columns])
+
+    # Строки с номерами row_ids списком; значения берутся из столбцов itemgetter на C
+    def take(self, row_ids):
+        row_ids = list(row_ids)
+        if len(row_ids) < 2 or not self.columns:
+            return [self[row] for row in row_ids]
+        records = list(map(self.cls, zip(*map(itemgetter(*row_ids), self.columns))))
+        if self.others:
+            for position, row in enumerate(row_ids):
+                if row in self.others:
+                    records[position] = self.others[row]
+        return records
+
+    def __setitem__(self, row, record):
+        record = pack(record)
+        if record is not None and not self.names:
+            self.adopt(type(record))
+        if record is None or type(record) is not self.cls:
+            self.others[row] = record
+            return
+        self.others.pop(row, None)
+        for position, value in enumerate(tuple.__iter__(record)):
+            column = self.columns[position]
+            if not fits(column, value):
+                column = self.columns[position] = list(column)
+            column[row] = value
+
+    # Первая строка с полями в таблице, где полей ещё нет: её набор полей становится общим
+    def adopt(self, cls):
+        self.names = cls.names
+        self.cls = cls
+        self.columns = [[None] * self.length for _ in cls.names]
+        self.others = {row: self.others.get(row) for row in range(self.length)}
+
+    def append(self, record):
+        for column in self.columns:
+            column.append(column[-1] if len(column) else None)
+        if not self.columns:
+            self.others[self.length] = None
+        self.length += 1
+        self[self.length - 1] = record
+
+    def __iter__(self):
+        if not self.columns:
+            return iter([self.others.get(row) for row in range(self.length)])
+        records = map(self.cls, zip(*self.columns))
+        if not self.others:
+            return records
+        others = self.others
+        return (others[row] if row in others else record for row, record in enumerate(records))
+
+    def count(self, value):
+        if value is None:
+            return sum(record is None for record in self.others.values())
+        return sum(record == value for record in self)
+
+    # Признаки живых строк (не удалённых)
+    def alive(self):
+        flags = [True] * self.length
+        for row, record in self.others.items():
+            if record is None:
+                flags[row] = False
+        return flags
+
+    # Значения поля: копия столбца (массив, если строк вне столбцов нет), иначе список
+    def column(self, name):
+        position = self.cls.positions.get(name)
+        if position is None:
+            values = [None] * self.length
+        elif self.others:
+            values = list(self.columns[position])
+        else:
+            return self.columns[position][:]
+        for row, record in self.others.items():
+            values[row] = None if record is None else record.get(name)
+        return values
+
+
+# Упаковка всех строк при загрузке в таблицу (Table). Общий набор полей — у
+# первой строки; пока он не меняется, itemgetter для значений не ищется заново.
+# Значения строк сначала собираются списками, потом разбираются на столбцы.
+# Повторяющиеся короткие строки сводятся к одному экземпляру через словарь на
+# время загрузки, а не sys.intern: уникальные значения (имена) иначе навсегда
+# занимали бы место ещё и в таблице интернированных строк
+def pack_all(records):
+    rows = []
+    others = {}
+    shared = {}
+    share = shared.setdefault
+    names = keys = None
+    for row, record in enumerate(records):
+        if names is None and record is not None:
+            names = record.names if isinstance(record, Record) else tuple(record)
+            cls, keys = record_type(names), set(names)
+            getter = itemgetter(*names) if len(names) > 1 else lambda record: tuple(record.values())
+        if record is None:
+            others[row] = None
+        elif type(record) is cls:
+            rows.append(tuple.__getitem__(record, slice(None)))
+            continue
+        elif isinstance(record, Record) or record.keys() != keys:
+            others[row] = pack(record)
+        else:
+            rows.append([
+                share(value, value) if type(value) is str and len(value) <= INTERN_MAX else value
+                for value in getter(record)
+            ])
+            continue
+        rows.append(None)
+
+    if not names:
+        return Table(others=others, length=len(rows))
+    if others:
+        filler = next(values for values in rows if values is not None)
+        rows = [filler if values is None else values for values in rows]
+    return Table(names, map(typed_column, zip(*rows)), others, len(rows))
+
+
+# Строки с номерами row_ids списком (для таблицы — без сборки строк по одной)
+def take(rows, row_ids):
+    if isinstance(rows, Table):
+        return rows.take(row_ids)
+    return [rows[row] for row in row_ids]
+
+
+# Признаки живых строк (удалённые строки — None)
+def alive(rows):
+    if isinstance(rows, Table):
+        return rows.alive()
+    return [record is not None for record in rows]
+
+
+# Значения поля во всех строках (None для удалённых строк и строк без поля).
+# Если все строки одного класса, значения берутся по позиции, без вызова get на каждую строку
+def column(rows, name):
+    if isinstance(rows, Table):
+        return rows.column(name)
+    kinds = set(map(type, rows))
+    has_deleted = type(None) in kinds
+    kinds.discard(type(None))
+    if len(kinds) == 1:
+        cls = kinds.pop()
+        if issubclass(cls, Record):
+            position = cls.positions.get(name)
+            if position is None:
+                return [None] * len(rows)
+            if not has_deleted:
+                return list(map(tuple.__getitem__, rows, repeat(position)))
+            get = tuple.__getitem__
+            return [None if record is None else get(record, position) for record in rows]
+    return [None if record is None else record.get(name) for record in rows]
+
+
+# Значения нескольких полей: {имя: столбец}. Каждый столбец берётся отдельным
+# проходом map на C — это быстрее, чем разбирать каждую строку на все поля сразу
+def columns(rows, names):
+    return {name: column(rows, name) for name in names}
+
+
+# Record -> обычный словарь (для записи в JSON)
+def unpack(record):
+    return record.to_dict() if isinstance(record, Record) else record
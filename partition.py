@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import zlib
+
+import jsonl
+import packed
+import storage
+
+# Секционированная база (.parts): файл-описание
+#   {"format": "parts", "fields": [...], "key_fields": [...], "partitions": N, "segments": [...]}
+# и N секций в каталоге <имя>.seg/ — обычных файлов JSON Lines. Запись попадает
+# в секцию по crc32 от ключевых полей (без ключа — по очереди), поэтому номер
+# секции одинаков во всех процессах и запусках.
+# Имя секции содержит хеш её содержимого: при перезаписи базы (свёртке журнала)
+# на диск пишутся только изменившиеся секции, а файл-описание заменяется последним.
+# Здесь только чтение и запись; параллельные запросы по секциям — в partscan
+EXTENSION = ".parts"
+SEGMENT_SUFFIX = ".seg"
+PARTITIONS = 8
+
+
+def is_partitioned(file_path):
+    return file_path.lower().endswith(EXTENSION)
+
+
+# Временный файл атомарной записи (<имя>.tmp.parts) пишет секции в тот же каталог, что и основной
+def segment_dir(file_path):
+    return os.path.splitext(storage.final_path(file_path))[0] + SEGMENT_SUFFIX
+
+
+def read_manifest(file_path):
+    with open(file_path, "r", encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get("format") != "parts":
+        raise ValueError("Файл не является секционированной базой!")
+    return manifest
+
+
+def read_header(file_path):
+    manifest = read_manifest(file_path)
+    return manifest.get("fields", []), manifest.get("key_fields", [])
+
+
+def segment_paths(file_path):
+    folder = segment_dir(file_path)
+    return [os.path.join(folder, name) for name in read_manifest(file_path)["segments"]]
+
+
+def iter_partitioned(file_path):
+    for path in segment_paths(file_path):
+        yield from jsonl.iter_jsonl(path)
+
+
+def read_partitioned(file_path):
+    fields, key_fields = read_header(file_path)
+    return fields, list(iter_partitioned(file_path)), key_fields
+
+
+def partition_of(key, partitions):
+    return zlib.crc32(json.dumps(list(key), ensure_ascii=False).encode("utf-8")) % partitions
+
+
+def write_bytes(path, data):
+    with open(path, "wb") as segment_file:
+        segment_file.write(data)
+
+
+# Запись базы по секциям. Число секций сохраняется от прежней версии файла.
+# Секции, которых нет ни в прежнем, ни в новом описании (остатки позапрошлой
+# записи и прерванных записей), удаляются.
+# Возвращает записи в том порядке, в котором они лежат в файле (по секциям)
+def write_partitioned(file_path, fields, data, key_fields=None):
+    data = data if isinstance(data, list) else list(data)
+    target = storage.final_path(file_path)
+    previous = read_manifest(target) if os.path.exists(target) else None
+    partitions = previous["partitions"] if previous is not None else PARTITIONS
+
+    groups = [[] for _ in range(partitions)]
+    for i, record in enumerate(data):
+        number = partition_of(storage.record_key(record, key_fields), partitions) if key_fields else i % partitions
+        groups[number].append(record)
+
+    folder = segment_dir(file_path)
+    os.makedirs(folder, exist_ok=True)
+    segments = []
+    for number, group in enumerate(groups):
+        text = "".join(jsonl.jsonl_lines(fields, map(packed.unpack, group), key_fields)).encode("utf-8")
+        name = f"{number}-{hashlib.sha256(text).hexdigest()[:16]}{jsonl.EXTENSION}"
+        path = os.path.join(folder, name)
+        if not os.path.exists(path):
+            storage.write_atomic(path, lambda temp_path: write_bytes(temp_path, text))
+        segments.append(name)
+
+    manifest = {"format": "parts", "fields": fields, "partitions": partitions, "segments": segments, "rows": [len(group) for group in groups]}
+    if key_fields is not None:
+        manifest["key_fields"] = key_fields
+    with open(file_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4, ensure_ascii=False)
+
+    used = set(segments) | set(previous["segments"] if previous is not None else [])
+    for name in os.listdir(folder):
+        if name not in used:
+            os.remove(os.path.join(folder, name))
+    return [record for group in groups for record in group]
@@ -0,0 +1,136 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import aggregate
+import jsonl
+import partition
+import profiler
+import query
+import storage
+
+# Запросы, подсчёт и итоги по секционированной базе (.parts) без её загрузки:
+# секции просматриваются параллельно в ProcessPoolExecutor, журнал накладывается
+# поверх результатов. Модуль нужен только командной строке; хранилище его не импортирует
+# Число процессов (None — по числу ядер); при 1 секции или 1 процессе работа идёт без пула
+WORKERS = None
+
+
+# Ключи, затронутые журналом (строки снимка с этими ключами берутся из журнала)
+def log_keys(entries, key_fields):
+    keys = set()
+    for entry in entries:
+        if "key" in entry:
+            keys.add(tuple(entry["key"]))
+        if "record" in entry:
+            keys.add(storage.record_key(entry["record"], key_fields))
+    return keys
+
+
+# Записи секции, не затронутые журналом; затронутые складываются в base
+def segment_records(path, key_fields, touched, base):
+    for record in jsonl.iter_jsonl(path):
+        if touched:
+            key = storage.record_key(record, key_fields)
+            if key in touched:
+                base[key] = record
+                continue
+        yield record
+
+
+# Работа одного процесса над секцией: task — ("rows", limit), ("count",) или
+# ("aggregate", поле значения, поле группировки).
+# Возвращает (результат, число просмотренных записей, затронутые журналом записи секции)
+def scan_segment(path, where, key_fields, touched, task):
+    base = {}
+    scanned = 0
+    matched = []
+    totals = {}
+    counted = 0
+    for record in segment_records(path, key_fields, touched, base):
+        scanned += 1
+        if where is not None and not query.evaluate(where, record):
+            continue
+        if task[0] == "rows":
+            matched.append(record)
+            if task[1] is not None and len(matched) >= task[1]:
+                break
+        elif task[0] == "count":
+            counted += 1
+        else:
+            aggregate.accumulate(totals, [record], task[1], task[2])
+    result = matched if task[0] == "rows" else counted if task[0] == "count" else totals
+    return result, scanned, base
+
+
+# Выполнение task по всем секциям и записи, изменённые журналом:
+# (результаты секций, записи из журнала, прошедшие условие)
+def scan(file_path, where, task):
+    fields, key_fields = partition.read_header(file_path)
+    entries = storage.read_log(file_path) if key_fields else []
+    touched = log_keys(entries, key_fields)
+    paths = partition.segment_paths(file_path)
+
+    arguments = (repeat(where), repeat(key_fields), repeat(touched), repeat(task))
+    workers = min(len(paths), WORKERS or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(scan_segment, paths, *arguments))
+    else:
+        parts = list(map(scan_segment, paths, *arguments))
+
+    # Затронутые журналом записи: состояние снимка плюс журнал, как в apply_entries
+    state = {}
+    for _, _, base in parts:
+        state.update(base)
+    for entry in entries:
+        if entry["op"] == "add":
+            state[storage.record_key(entry["record"], key_fields)] = entry["record"]
+        elif entry["op"] == "edit":
+            if state.pop(tuple(entry["key"]), None) is not None:
+                state[storage.record_key(entry["record"], key_fields)] = entry["record"]
+        elif entry["op"] == "delete":
+            state.pop(tuple(entry["key"]), None)
+    changed = [record for record in state.values() if where is None or query.evaluate(where, record)]
+
+    profiler.count("partition_scan", rows_scanned=sum(scanned for _, scanned, _ in parts) + len(state), scans=len(paths))
+    return [result for result, _, _ in parts], changed
+
+
+# Запрос на языке query без загрузки базы. Записи идут по секциям, а не в порядке строк.
+# Возвращает (столбцы, записи)
+@profiler.timed("partition_query")
+def parallel_query(file_path, text):
+    fields, _ = partition.read_header(file_path)
+    parsed = query.parse(text, fields)
+    parts, changed = scan(file_path, parsed.where, ("rows", parsed.limit))
+    found = [record for part in parts for record in part] + changed
+    if parsed.limit is not None:
+        found = found[:parsed.limit]
+    columns = parsed.columns or [field["name"] for field in fields]
+    if parsed.columns is not None:
+        found = [{name: record.get(name) for name in columns} for record in found]
+    profiler.count("partition_query", rows_returned=len(found))
+    return columns, found
+
+
+# Число записей, подходящих под условие (None — все записи)
+@profiler.timed("partition_count")
+def parallel_count(file_path, text=None):
+    fields, _ = partition.read_header(file_path)
+    where = query.parse(text, fields).where if text else None
+    parts, changed = scan(file_path, where, ("count",))
+    return sum(parts) + len(changed)
+
+
+# Итоги по группам (как aggregate.aggregate), посчитанные по секциям и сложенные
+@profiler.timed("partition_aggregate")
+def parallel_aggregate(file_path, value_field=None, group_field=None, text=None):
+    fields, _ = partition.read_header(file_path)
+    aggregate.check_fields(fields, value_field, group_field)
+    where = query.parse(text, fields).where if text else None
+    parts, changed = scan(file_path, where, ("aggregate", value_field, group_field))
+    totals = aggregate.accumulate({}, changed, value_field, group_field)
+    for part in parts:
+        aggregate.merge_totals(totals, part)
+    return sorted(aggregate.totals_list(totals, value_field), key=aggregate.group_sort_key)
@@ -0,0 +1,112 @@
+import functools
+import io
+import json
+import threading
+import time
+
+# Счётчики операций: сколько раз вызвана, сколько заняла времени, сколько байт
+# прочитано и записано, сколько строк просмотрено и возвращено, сколько раз
+# поиск пошёл по индексу и сколько — перебором. Функции помечаются декоратором
+# @timed("имя"), а внутри добавляют свои величины через count("имя", ...)
+COUNTERS = ["bytes_read", "bytes_written", "rows_scanned", "rows_returned", "index_hits", "scans"]
+# Сколько строк отчёта cProfile сохранять
+PROFILE_LINES = 40
+
+enabled = True
+stats = {}
+lock = threading.Lock()
+local = threading.local()
+
+# Профилирование через cProfile следующей операции верхнего уровня
+capture_armed = False
+last_profile = None
+
+
+def new_entry():
+    entry = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+    entry.update((name, 0) for name in COUNTERS)
+    return entry
+
+
+def count(name, **amounts):
+    if not enabled:
+        return
+    with lock:
+        entry = stats.setdefault(name, new_entry())
+        for key, amount in amounts.items():
+            entry[key] += amount
+
+
+def record_time(name, seconds):
+    with lock:
+        entry = stats.setdefault(name, new_entry())
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+
+# Включение cProfile для следующей операции; отчёт появится в last_profile
+def capture_next():
+    global capture_armed
+    capture_armed = True
+
+
+def timed(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+
+            global capture_armed
+            depth = getattr(local, "depth", 0)
+            profile = None
+            if capture_armed and depth == 0:
+                capture_armed = False
+                # cProfile и pstats нужны только при захвате, поэтому не загружаются при запуске
+                import cProfile
+                profile = cProfile.Profile()
+
+            local.depth = depth + 1
+            start = time.perf_counter()
+            try:
+                if profile is not None:
+                    return profile.runcall(function, *args, **kwargs)
+                return function(*args, **kwargs)
+            finally:
+                local.depth = depth
+                record_time(name, time.perf_counter() - start)
+                if profile is not None:
+                    save_profile(name, profile)
+        return wrapper
+    return decorator
+
+
+def save_profile(name, profile):
+    global last_profile
+    import pstats
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    last_profile = {"operation": name, "created": time.strftime("%Y-%m-%d %H:%M:%S"), "report": output.getvalue()}
+
+
+# Копия счётчиков: имя операции -> величины, плюс среднее время вызова
+def snapshot():
+    with lock:
+        result = {name: dict(entry) for name, entry in stats.items()}
+    for entry in result.values():
+        entry["avg_seconds"] = entry["seconds"] / entry["calls"] if entry["calls"] else 0.0
+    return result
+
+
+def reset():
+    global last_profile
+    with lock:
+        stats.clear()
+    last_profile = None
+
+
+def export(file_path):
+    report = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "operations": snapshot(), "profile": last_profile}
+    with open(file_path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=4, ensure_ascii=False)
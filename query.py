@@ -0,0 +1,290 @@
+import re
+
+import storage
+import indexes
+import packed
+import profiler
+
+# Язык запросов:
+#   SELECT имя, возраст WHERE возраст >= 18 AND (город = Москва OR город IN ("Тула", "Тверь")) LIMIT 10
+# SELECT, WHERE и LIMIT необязательны: "возраст > 30" — это условие без проекции.
+# Операции: = != > < >= <= BETWEEN x AND y, IN (...), CONTAINS (подстрока), STARTSWITH (начало строки);
+# условия объединяются AND и OR, есть скобки.
+# Имена полей с пробелами пишутся в обратных кавычках: `дата рождения`.
+# Значения приводятся к типу поля из схемы.
+COMPARISONS = ["=", "!=", ">", "<", ">=", "<="]
+KEYWORDS = ["SELECT", "WHERE", "AND", "OR", "IN", "BETWEEN", "CONTAINS", "STARTSWITH", "LIMIT"]
+# Сколько строк выборка достаёт из базы за раз (строки собираются из столбцов пачкой)
+SELECT_ROWS = 256
+
+TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![^\s()=<>!,'"`]))
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<name>`[^`]+`)
+      | (?P<symbol>>=|<=|!=|<>|=|>|<|\(|\)|,|\*)
+      | (?P<word>[^\s()=<>!,'"`]+)
+    )""", re.VERBOSE)
+
+
+# Разбиение текста запроса на лексемы (вид, текст)
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Непонятный текст в запросе: {text[position:]}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = re.sub(r"\\(.)", r"\1", value[1:-1])
+        elif kind == "name":
+            value = value[1:-1]
+        elif kind == "word" and value.upper() in KEYWORDS:
+            kind, value = "keyword", value.upper()
+        elif kind == "symbol" and value == "<>":
+            value = "!="
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+# Разобранный запрос: список полей (None — все), дерево условия (None — все записи), LIMIT.
+# Узлы условия: ("and", [узлы]), ("or", [узлы]),
+# ("cmp", поле, операция, значение, верхняя граница), ("in", поле, [значения])
+class Query:
+    def __init__(self, columns, where, limit):
+        self.columns = columns
+        self.where = where
+        self.limit = limit
+
+
+class Parser:
+    def __init__(self, text, fields):
+        self.tokens = tokenize(text)
+        self.position = 0
+        self.types = {field["name"]: field["type"] for field in fields}
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError("Неожиданный конец запроса")
+        self.position += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, kind, value):
+        if not self.accept(kind, value):
+            found = self.peek()[1]
+            raise ValueError(f"Ожидалось '{value}', получено " + ("конец запроса" if found is None else f"'{found}'"))
+
+    def parse(self):
+        columns = None
+        where = None
+        limit = None
+
+        if self.accept("keyword", "SELECT"):
+            columns = self.parse_columns()
+        if self.accept("keyword", "WHERE") or self.peek()[0] not in (None, "keyword"):
+            where = self.parse_or()
+        if self.accept("keyword", "LIMIT"):
+            kind, value = self.take()
+            if kind != "number" or not value.isdigit():
+                raise ValueError("LIMIT должен быть целым неотрицательным числом")
+            limit = int(value)
+        if self.peek()[0] is not None:
+            raise ValueError(f"Лишний текст в запросе: '{self.peek()[1]}'")
+        return Query(columns, where, limit)
+
+    def parse_columns(self):
+        if self.accept("symbol", "*"):
+            return None
+        columns = [self.field_name()]
+        while self.accept("symbol", ","):
+            columns.append(self.field_name())
+        return columns
+
+    def field_name(self):
+        kind, value = self.take()
+        if kind not in ("word", "name"):
+            raise ValueError(f"Ожидалось имя поля, получено '{value}'")
+        if value not in self.types:
+            raise ValueError(f"Неизвестное поле: {value}")
+        return value
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.accept("keyword", "OR"):
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_condition()]
+        while self.accept("keyword", "AND"):
+            nodes.append(self.parse_condition())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_condition(self):
+        if self.accept("symbol", "("):
+            node = self.parse_or()
+            self.expect("symbol", ")")
+            return node
+
+        field = self.field_name()
+        if self.accept("keyword", "IN"):
+            self.expect("symbol", "(")
+            values = [self.value(field)]
+            while self.accept("symbol", ","):
+                values.append(self.value(field))
+            self.expect("symbol", ")")
+            return ("in", field, values)
+        if self.accept("keyword", "BETWEEN"):
+            low = self.value(field)
+            self.expect("keyword", "AND")
+            return ("cmp", field, "between", low, self.value(field))
+        for keyword in ("CONTAINS", "STARTSWITH"):
+            if self.accept("keyword", keyword):
+                return ("cmp", field, keyword.lower(), self.value(field), None)
+
+        kind, op = self.take()
+        if kind != "symbol" or op not in COMPARISONS:
+            raise ValueError(f"Ожидалась операция сравнения после '{field}', получено '{op}'")
+        return ("cmp", field, op, self.value(field), None)
+
+    # Значение, приведённое к типу поля
+    def value(self, field):
+        kind, value = self.take()
+        if kind not in ("number", "string", "word"):
+            raise ValueError(f"Ожидалось значение для '{field}', получено '{value}'")
+        try:
+            return storage.convert_value(self.types[field], value)
+        except ValueError:
+            raise ValueError(f"Значение '{value}' не подходит к типу {self.types[field]} поля '{field}'")
+
+
+def parse(text, fields):
+    return Parser(text, fields).parse()
+
+
+# Проверка записи по дереву условия
+def evaluate(node, record):
+    kind = node[0]
+    if kind == "and":
+        return all(evaluate(child, record) for child in node[1])
+    if kind == "or":
+        return any(evaluate(child, record) for child in node[1])
+    if kind == "in":
+        return record.get(node[1]) in node[2]
+    _, field, op, value, upper = node
+    if op == "!=":
+        return record.get(field) != value
+    return indexes.matches(record.get(field), op, value, upper)
+
+
+# Способ получить строки-кандидаты по индексам: (оценка числа строк, функция выборки, описание)
+# или None, если условие индексами не покрывается
+def access_path(node, table_indexes):
+    kind = node[0]
+    if kind == "cmp":
+        _, field, op, value, upper = node
+        index = table_indexes.indexes.get(field)
+        estimate = index.estimate(op, value, upper) if index is not None else None
+        if estimate is None:
+            return None
+        bound = f"{value!r} AND {upper!r}" if op == "between" else repr(value)
+        return estimate, lambda: index.search(op, value, upper), f"{index.kind}-индекс {field} {op} {bound} (~{estimate} строк)"
+
+    if kind == "in":
+        _, field, values = node
+        index = table_indexes.indexes.get(field)
+        estimates = [index.estimate("=", value) for value in values] if index is not None else [None]
+        if None in estimates:
+            return None
+        estimate = sum(estimates)
+        fetch = lambda: sorted(set().union(*(index.search("=", value) for value in values)))
+        return estimate, fetch, f"{index.kind}-индекс {field} IN {values!r} (~{estimate} строк)"
+
+    paths = [access_path(child, table_indexes) for child in node[1]]
+    if kind == "and":
+        # Самый избирательный индекс; остальные условия проверяются по найденным строкам
+        paths = [path for path in paths if path is not None]
+        return min(paths, key=lambda path: path[0]) if paths else None
+
+    # OR покрывается индексами, только если покрыта каждая ветка
+    if None in paths:
+        return None
+    estimate = sum(path[0] for path in paths)
+    fetch = lambda: sorted(set().union(*(path[1]() for path in paths)))
+    return estimate, fetch, "объединение: " + "; ".join(path[2] for path in paths) + f" (~{estimate} строк)"
+
+
+# План выполнения: (функция выборки номеров строк или None для перебора, описание)
+def plan(query, table_indexes, total):
+    if query.where is None:
+        return None, f"полный просмотр без условия ({total} строк)"
+    path = access_path(query.where, table_indexes)
+    if path is None or path[0] >= total:
+        return None, f"полный перебор ({total} строк), подходящих индексов нет"
+    return path[1], path[2] + ", затем проверка всего условия"
+
+
+# Текстовое описание плана запроса
+def explain(db, text):
+    query = parse(text, db.fields)
+    return plan(query, db.indices, db.count())[1]
+
+
+# Найденные записи по одной (с проекцией). Счётчики профилировщика
+# обновляются, когда выборка пройдена до конца
+def select(db, query, columns, fetch):
+    row_ids = fetch() if fetch is not None else db.row_ids()
+    records = (
+        record
+        for start in range(0, len(row_ids), SELECT_ROWS)
+        for record in packed.take(db.rows, row_ids[start:start + SELECT_ROWS])
+    )
+    returned = 0
+    scanned = 0
+    for record in records:
+        if query.limit is not None and returned >= query.limit:
+            break
+        scanned += 1
+        if record is None or (query.where is not None and not evaluate(query.where, record)):
+            continue
+        returned += 1
+        yield record if query.columns is None else {name: record.get(name) for name in columns}
+
+    if fetch is not None:
+        profiler.count("query", index_hits=1, rows_scanned=scanned, rows_returned=returned)
+    else:
+        profiler.count("query", scans=1, rows_scanned=scanned, rows_returned=returned)
+
+
+# Выполнение запроса над открытой базой (database.Database).
+# Возвращает имена столбцов, найденные записи (с проекцией) и описание плана
+@profiler.timed("query")
+def execute(db, text):
+    query = parse(text, db.fields)
+    fetch, description = plan(query, db.indices, db.count())
+    columns = query.columns or [field["name"] for field in db.fields]
+    return columns, list(select(db, query, columns, fetch)), description
+
+
+# То же без списка найденных записей: имена столбцов и генератор записей
+# (для выгрузки больших выборок)
+def stream(db, text):
+    query = parse(text, db.fields)
+    fetch, _ = plan(query, db.indices, db.count())
+    columns = query.columns or [field["name"] for field in db.fields]
+    return columns, select(db, query, columns, fetch)
@@ -0,0 +1,599 @@
+import json
+import os
+from itertools import compress, count
+
+import blocks
+import columnar
+import jsonl
+import packed
+import partition
+import profiler
+
+# Журнал изменений лежит рядом с основным файлом: <файл>.log
+LOG_SUFFIX = ".log"
+# Первичный индекс по ключевым полям: <файл>.idx
+INDEX_SUFFIX = ".idx"
+# Если выключить, каждое изменение снова будет перезаписывать весь файл
+LOG_MODE = True
+# После превышения этого размера журнал сворачивается в новый снимок
+COMPACT_THRESHOLD = 8 * 1024 * 1024
+# Сколько байт с конца файла индекса читается в поисках последнего изменения
+INDEX_TAIL = 1024 * 1024
+# Метка временного файла атомарной записи: <имя>.tmp<расширение>
+TEMP_SUFFIX = ".tmp"
+# Журнал прежнего снимка на время его замены: <файл>.log.stale
+STALE_SUFFIX = ".stale"
+# Сбрасывать ли записанное на диск (fsync). Без этого сбой питания может
+# потерять последние изменения, хотя файл всё равно останется целым
+SYNC_WRITES = True
+
+
+def log_path(file_path):
+    return file_path + LOG_SUFFIX
+
+
+def index_path(file_path):
+    return file_path + INDEX_SUFFIX
+
+
+def stale_log_path(file_path):
+    return log_path(file_path) + STALE_SUFFIX
+
+
+def temp_path(file_path):
+    base, extension = os.path.splitext(file_path)
+    return base + TEMP_SUFFIX + extension
+
+
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+# Отпечаток файла данных: по нему индекс понимает, что снимок не менялся
+def file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def record_key(record, key_fields):
+    return tuple(record[field] for field in key_fields)
+
+
+# Ключевые поля базы; без них журнал и первичный индекс недоступны
+def get_key_fields(file_path):
+    _, key_fields = read_header(file_path)
+    if not key_fields:
+        raise ValueError("Ключевые поля не указаны!")
+    return key_fields
+
+
+# Преобразование введённого значения к типу поля из схемы
+def convert_value(field_type, value):
+    if field_type == "int":
+        return int(value)
+    if field_type == "float":
+        return float(value)
+    return value
+
+
+# Чтение базового снимка без учёта журнала. Формат определяется по расширению:
+# .jsonl — JSON Lines, .col — колоночный двоичный, .parts — секционированный,
+# .blk — сжатый блочный, иначе обычный JSON с отступами
+def read_snapshot(file_path):
+    if jsonl.is_jsonl(file_path):
+        return jsonl.read_jsonl(file_path)
+    if columnar.is_columnar(file_path):
+        return columnar.read_columnar(file_path)
+    if partition.is_partitioned(file_path):
+        return partition.read_partitioned(file_path)
+    if blocks.is_blocks(file_path):
+        return blocks.read_blocks(file_path)
+    with open(file_path, "r", encoding="utf-8") as db_file:
+        db_data = json.load(db_file)
+    return db_data.get("fields", []), db_data.get("data", []), db_data.get("key_fields", [])
+
+
+# Схема и ключевые поля (для JSON Lines и колоночного формата — без чтения данных)
+def read_header(file_path):
+    if jsonl.is_jsonl(file_path):
+        return jsonl.read_header(file_path)
+    if columnar.is_columnar(file_path):
+        return columnar.read_header(file_path)
+    if partition.is_partitioned(file_path):
+        return partition.read_header(file_path)
+    if blocks.is_blocks(file_path):
+        return blocks.read_header(file_path)
+    fields, _, key_fields = read_snapshot(file_path)
+    return fields, key_fields
+
+
+# Записи снимка по одной (для JSON Lines и колоночного формата — без загрузки всего файла)
+def iter_snapshot(file_path):
+    if jsonl.is_jsonl(file_path):
+        return jsonl.iter_jsonl(file_path)
+    if columnar.is_columnar(file_path):
+        return columnar.iter_columnar(file_path)
+    if partition.is_partitioned(file_path):
+        return partition.iter_partitioned(file_path)
+    if blocks.is_blocks(file_path):
+        return blocks.iter_blocks(file_path)
+    return iter(read_snapshot(file_path)[1])
+
+
+def sync_file(path):
+    if not SYNC_WRITES:
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Сброс каталога, чтобы переименование файла тоже пережило сбой (только POSIX)
+def sync_dir(path):
+    if SYNC_WRITES and os.name == "posix":
+        sync_file(os.path.dirname(os.path.abspath(path)))
+
+
+# Атомарная запись файла: write(временный путь) пишет во временный файл рядом
+# с целевым, он сбрасывается на диск и только потом заменяет целевой.
+# При сбое на диске остаётся либо старый файл целиком, либо новый.
+# Расширение у временного файла то же, что у целевого, — по нему выбирается формат.
+# before_replace() вызывается, когда временный файл уже записан, но ещё не заменил целевой.
+# Возвращает результат write
+def write_atomic(file_path, write, before_replace=None):
+    temp = temp_path(file_path)
+    try:
+        result = write(temp)
+        sync_file(temp)
+        if before_replace is not None:
+            before_replace()
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    os.replace(temp, file_path)
+    sync_dir(file_path)
+    return result
+
+
+# Путь, который заменит временный файл write_atomic (для самого целевого файла — он же).
+# Нужен форматам, которые при записи используют прежнюю версию файла
+def final_path(file_path):
+    base, extension = os.path.splitext(file_path)
+    if base.endswith(TEMP_SUFFIX):
+        base = base[:-len(TEMP_SUFFIX)]
+    return base + extension
+
+
+# Запись снимка в файл в формате, заданном расширением (data — любые итерируемые записи).
+# Упакованные строки (packed.Record) для JSON переводятся обратно в словари.
+# Секционированный формат раскладывает записи по секциям, и при чтении они идут
+# в другом порядке: для него возвращается список записей в порядке файла, иначе None
+def write_file(file_path, fields, data, key_fields=None):
+    if columnar.is_columnar(file_path):
+        columnar.write_columnar(file_path, fields, data, key_fields)
+    elif partition.is_partitioned(file_path):
+        return partition.write_partitioned(file_path, fields, data, key_fields)
+    elif blocks.is_blocks(file_path):
+        blocks.write_blocks(file_path, fields, data, key_fields)
+    elif jsonl.is_jsonl(file_path):
+        jsonl.write_jsonl(file_path, fields, map(packed.unpack, data), key_fields)
+    else:
+        jsonl.write_json_stream(file_path, fields, map(packed.unpack, data), key_fields)
+
+
+# Журнал и снимок заменяются не одной операцией. Перед заменой снимка журнал
+# переименовывается в <файл>.log.stale и удаляется после неё. Если сбой
+# случился между ними, по временному файлу видно, успел ли снимок замениться:
+# временный файл на месте — снимок прежний, и журнал возвращается; иначе журнал
+# относится к старому снимку и удаляется. Применять его к новому снимку нельзя:
+# добавления и правки, уже вошедшие в снимок, дали бы повторяющиеся ключи
+def recover_log(file_path):
+    stale = stale_log_path(file_path)
+    if not os.path.exists(stale):
+        return
+    if os.path.exists(temp_path(file_path)) and not os.path.exists(log_path(file_path)):
+        os.replace(stale, log_path(file_path))
+    else:
+        os.remove(stale)
+    sync_dir(stale)
+
+
+def set_log_aside(file_path):
+    if os.path.exists(log_path(file_path)):
+        os.replace(log_path(file_path), stale_log_path(file_path))
+        sync_dir(file_path)
+
+
+# Запись нового снимка (write(временный путь) пишет файл), после которой
+# прежние журнал и индекс не нужны. Возвращает результат write
+def replace_snapshot(file_path, write):
+    recover_log(file_path)
+    result = write_atomic(file_path, write, lambda: set_log_aside(file_path))
+    recover_log(file_path)
+    if os.path.exists(index_path(file_path)):
+        os.remove(index_path(file_path))
+    return result
+
+
+# Полная запись снимка; журнал после этого не нужен.
+# Возвращает строки в порядке файла (номера строк те же, что после повторного
+# чтения) и новый первичный индекс (None, если его нельзя построить)
+@profiler.timed("write_db")
+def write_snapshot(file_path, fields, data, key_fields=None):
+    written = replace_snapshot(file_path, lambda temp_path: write_file(temp_path, fields, data, key_fields))
+    if written is not None:
+        data = written
+    profiler.count("write_db", bytes_written=file_size(file_path))
+
+    # Данные уже в памяти, поэтому индекс строится без повторного чтения файла
+    try:
+        if not key_fields:
+            raise ValueError("Ключевые поля не указаны!")
+        index = build_index(data, key_fields)
+        save_index(file_path, index, key_fields, len(data))
+        return data, index
+    except ValueError:
+        return data, None
+
+
+# Чтение записей журнала. Оборванная последняя строка (сбой во время записи) отбрасывается
+def read_log(file_path):
+    recover_log(file_path)
+    path = log_path(file_path)
+    if not os.path.exists(path):
+        return []
+
+    entries = []
+    with open(path, "r", encoding="utf-8") as log_file:
+        for line in log_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return entries
+
+
+# Применение записей журнала к строкам и первичному индексу (ключ -> номер строки).
+# Номер строки стабилен: строки снимка, затем добавленные через журнал;
+# удалённые строки остаются в списке как None.
+# Возвращает изменения индекса для файла .idx.
+# on_change(номер строки, запись до, запись после) вызывается для каждой
+# изменённой строки — через него обновляются вторичные индексы
+def apply_entries(rows, index, entries, key_fields, on_change=None):
+    changes = []
+    for entry in entries:
+        op = entry["op"]
+        if op == "add":
+            key = record_key(entry["record"], key_fields)
+            if key in index:
+                row = index[key]
+                old = rows[row]
+            else:
+                row = index[key] = len(rows)
+                old = None
+                rows.append(None)
+                changes.append(["+", list(key), row])
+            rows[row] = packed.pack(entry["record"])
+        elif op == "edit":
+            row = index.pop(tuple(entry["key"]), None)
+            if row is None:
+                continue
+            new_key = record_key(entry["record"], key_fields)
+            old = rows[row]
+            rows[row] = packed.pack(entry["record"])
+            index[new_key] = row
+            changes.append(["-", entry["key"]])
+            changes.append(["+", list(new_key), row])
+        elif op == "delete":
+            row = index.pop(tuple(entry["key"]), None)
+            if row is None:
+                continue
+            old = rows[row]
+            rows[row] = None
+            changes.append(["-", entry["key"]])
+        else:
+            continue
+
+        if on_change is not None:
+            on_change(row, old, rows[row])
+    return changes
+
+
+# Журнал поверх только что прочитанных строк (таблица data меняется на месте)
+def replay_log(data, key_fields, entries):
+    keys = zip(*[packed.column(data, field) for field in key_fields])
+    index = dict(zip(keys, count()))
+    apply_entries(data, index, entries, key_fields)
+    return data
+
+
+# Строки базы с сохранением номеров (удалённые строки — None).
+# Строки хранятся упакованными, по столбцам (packed.Table); JSON Lines, колоночный,
+# секционированный и сжатый блочный файлы упаковываются по мере чтения, без промежуточного списка словарей
+@profiler.timed("read_db")
+def load_rows(file_path):
+    if jsonl.is_jsonl(file_path) or columnar.is_columnar(file_path) or partition.is_partitioned(file_path) or blocks.is_blocks(file_path):
+        fields, key_fields = read_header(file_path)
+        data = packed.pack_all(iter_snapshot(file_path))
+    else:
+        fields, data, key_fields = read_snapshot(file_path)
+        data = packed.pack_all(data)
+    if key_fields:
+        entries = read_log(file_path)
+        if entries:
+            data = replay_log(data, key_fields, entries)
+    profiler.count("read_db", bytes_read=file_size(file_path) + file_size(log_path(file_path)), rows_scanned=len(data))
+    return fields, data, key_fields
+
+
+# Потоковое чтение текущего состояния: записи снимка идут по одной, а журнал
+# накладывается поверх. В памяти держатся только строки, затронутые журналом.
+# Порядок записей тот же, что у load_rows (без удалённых строк)
+def iter_records(file_path):
+    fields, key_fields = read_header(file_path)
+    entries = read_log(file_path) if key_fields else []
+    if not entries:
+        yield from iter_snapshot(file_path)
+        return
+
+    # Строка снимка обозначается ("base", ключ), добавленная — ("new", номер)
+    slot_of = {}
+    values = {}
+    for entry in entries:
+        op = entry["op"]
+        if op == "add":
+            key = record_key(entry["record"], key_fields)
+            slot = slot_of.get(key)
+            if slot is None:
+                slot = slot_of[key] = ("new", len(values))
+            values[slot] = entry["record"]
+        elif op == "edit":
+            slot = slot_of.pop(tuple(entry["key"]), ("base", tuple(entry["key"])))
+            values[slot] = entry["record"]
+            slot_of[record_key(entry["record"], key_fields)] = slot
+        elif op == "delete":
+            slot = slot_of.pop(tuple(entry["key"]), ("base", tuple(entry["key"])))
+            values[slot] = None
+
+    consumed = set()
+    for record in iter_snapshot(file_path):
+        key = record_key(record, key_fields)
+        slot = ("base", key)
+        if slot not in values:
+            # Добавление с ключом, который уже есть в снимке, заменяет строку на месте
+            new_slot = slot_of.get(key)
+            if new_slot is None or new_slot[0] != "new":
+                yield record
+                continue
+            slot = new_slot
+            consumed.add(slot)
+        if values[slot] is not None:
+            yield values[slot]
+
+    for slot, record in values.items():
+        if slot[0] == "new" and slot not in consumed and record is not None:
+            yield record
+
+
+# Конвертация базы между форматами (по расширению целевого файла).
+# Журнал исходной базы учитывается; в JSON и JSON Lines записи идут потоком,
+# колоночный формат пишется по столбцам, поэтому записи собираются в память
+@profiler.timed("convert")
+def convert(source_path, target_path):
+    fields, key_fields = read_header(source_path)
+    replace_snapshot(target_path, lambda temp_path: write_file(temp_path, fields, iter_records(source_path), key_fields))
+
+
+# Обрезка оборванной строки в конце журнала, чтобы новые записи не склеились с ней
+def repair_log(file_path):
+    recover_log(file_path)
+    path = log_path(file_path)
+    size = file_size(path)
+    if not size:
+        return
+    with open(path, "r+b") as log_file:
+        log_file.seek(size - 1)
+        if log_file.read(1) == b"\n":
+            return
+        log_file.seek(0)
+        tail = log_file.read().rfind(b"\n")
+        log_file.truncate(tail + 1)
+
+
+# Дописывание записей в журнал одним сбросом на диск (fsync на пачку, а не на запись)
+@profiler.timed("log_append")
+def append_log(file_path, entries):
+    repair_log(file_path)
+    path = log_path(file_path)
+    created = not os.path.exists(path)
+    text = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+    profiler.count("log_append", bytes_written=len(text.encode("utf-8")))
+    with open(path, "a", encoding="utf-8") as log_file:
+        log_file.write(text)
+        log_file.flush()
+        if SYNC_WRITES:
+            os.fsync(log_file.fileno())
+    if created:
+        sync_dir(path)
+
+
+def add_entry(record):
+    return {"op": "add", "record": packed.unpack(record)}
+
+
+def edit_entry(key, record):
+    return {"op": "edit", "key": list(key), "record": packed.unpack(record)}
+
+
+def delete_entry(key):
+    return {"op": "delete", "key": list(key)}
+
+
+# Свёртка журнала в новый снимок. Номера строк при этом пересчитываются,
+# поэтому возвращаются новые строки и индекс. Если строки уже в памяти,
+# файл повторно не читается
+@profiler.timed("compact")
+def compact(file_path, fields=None, rows=None, key_fields=None):
+    if rows is None:
+        fields, rows, key_fields = load_rows(file_path)
+    data = [record for record in rows if record is not None]
+    return write_snapshot(file_path, fields, data, key_fields)
+
+
+def compact_if_needed(file_path, fields=None, rows=None, key_fields=None):
+    if file_size(log_path(file_path)) > COMPACT_THRESHOLD:
+        return compact(file_path, fields, rows, key_fields)
+    return None
+
+
+# Построение первичного индекса: составной ключ -> номер строки.
+# Ключи собираются из столбцов ключевых полей, словарь — без цикла на Python;
+# повторяющиеся ключи ищутся, только если словарь вышел короче числа строк
+@profiler.timed("primary_index_build")
+def build_index(rows, key_fields):
+    if not key_fields:
+        raise ValueError("Ключевые поля не указаны!")
+    profiler.count("primary_index_build", rows_scanned=len(rows))
+    alive = packed.alive(rows)
+    columns = [packed.column(rows, field) for field in key_fields]
+    index = dict(zip(compress(zip(*columns), alive), compress(count(), alive)))
+    if len(index) != sum(alive):
+        seen = set()
+        for key in compress(zip(*columns), alive):
+            if key in seen:
+                raise ValueError(f"Дублирование ключа: {key}")
+            seen.add(key)
+    return index
+
+
+# Формат файла индекса (JSON Lines):
+#   1-я строка — заголовок с отпечатком снимка и размером журнала,
+#   2-я строка — пары [ключ, номер строки],
+#   далее — изменения ["+", ключ, строка, размер журнала] / ["-", ключ, размер журнала].
+# Индекс действителен, если отпечаток снимка и размер журнала совпадают с текущими
+def save_index(file_path, index, key_fields, next_row):
+    header = {
+        "key_fields": key_fields,
+        "snapshot": file_stamp(file_path),
+        "log": file_size(log_path(file_path)),
+        "next_row": next_row,
+    }
+    def write(temp_path):
+        with open(temp_path, "w", encoding="utf-8") as index_file:
+            index_file.write(json.dumps(header, ensure_ascii=False) + "\n")
+            index_file.write(json.dumps([[list(key), row] for key, row in index.items()], ensure_ascii=False) + "\n")
+
+    write_atomic(index_path(file_path), write)
+
+
+# Действителен ли файл индекса. Читаются только заголовок и последняя строка
+# (последнее изменение с размером журнала), пары ключей не разбираются
+def index_current(file_path):
+    path = index_path(file_path)
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, "rb") as index_file:
+            header = json.loads(index_file.readline())
+            if header["snapshot"] != file_stamp(file_path):
+                return False
+            pairs_start = index_file.tell()
+            size = index_file.seek(0, os.SEEK_END)
+            start = max(pairs_start, size - INDEX_TAIL)
+            index_file.seek(start)
+            lines = index_file.read().rstrip(b"\n").split(b"\n")
+            # Одна строка — это сами пары (изменений нет), иначе последняя строка — изменение
+            log_size = header["log"] if len(lines) < 2 else json.loads(lines[-1])[-1]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return False
+    return log_size == file_size(log_path(file_path))
+
+
+def load_index(file_path):
+    path = index_path(file_path)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "r", encoding="utf-8") as index_file:
+            header = json.loads(index_file.readline())
+            if header["snapshot"] != file_stamp(file_path):
+                return None
+
+            index = {tuple(key): row for key, row in json.loads(index_file.readline())}
+            next_row = header["next_row"]
+            log_size = header["log"]
+            for line in index_file:
+                change = json.loads(line)
+                if change[0] == "+":
+                    index[tuple(change[1])] = change[2]
+                    next_row = max(next_row, change[2] + 1)
+                else:
+                    index.pop(tuple(change[1]), None)
+                log_size = change[-1]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+    if log_size != file_size(log_path(file_path)):
+        return None
+    return index, next_row
+
+
+# Индекс из файла, а если он устарел — построенный заново и сохранённый.
+# Если строки уже прочитаны, они используются вместо повторного разбора файла
+def open_index(file_path, rows=None, key_fields=None):
+    loaded = load_index(file_path)
+    if loaded is not None and (rows is None or loaded[1] == len(rows)):
+        return loaded[0]
+
+    if rows is None:
+        _, rows, key_fields = load_rows(file_path)
+    if not key_fields:
+        raise ValueError("Ключевые поля не указаны!")
+    index = build_index(rows, key_fields)
+    save_index(file_path, index, key_fields, len(rows))
+    return index
+
+
+# Запись изменений в журнал; строки в памяти и индекс обновляются инкрементально
+def log_changes(file_path, entries, key_fields, rows, index, on_change=None):
+    append_log(file_path, entries)
+    append_index_changes(file_path, apply_entries(rows, index, entries, key_fields, on_change))
+
+
+# Изменения индекса (результат apply_entries) для уже записанного журнала.
+# Файл .idx восстанавливается по журналу, поэтому отдельно на диск не сбрасывается
+def append_index_changes(file_path, changes):
+    log_size = file_size(log_path(file_path))
+    with open(index_path(file_path), "a", encoding="utf-8") as index_file:
+        for change in changes:
+            index_file.write(json.dumps(change + [log_size], ensure_ascii=False) + "\n")
+
+
+# Индекс и номер следующей строки без чтения строк базы (для дописывания пачками)
+def index_state(file_path):
+    loaded = load_index(file_path)
+    if loaded is None:
+        open_index(file_path)
+        loaded = load_index(file_path)
+    return loaded
+
+
+# Дописывание новых записей в журнал без загрузки базы в память.
+# Уникальность ключей должна быть проверена заранее; возвращает номер следующей строки
+def log_adds(file_path, records, key_fields, index, next_row):
+    append_log(file_path, [add_entry(record) for record in records])
+    log_size = file_size(log_path(file_path))
+    with open(index_path(file_path), "a", encoding="utf-8") as index_file:
+        for record in records:
+            key = record_key(record, key_fields)
+            index[key] = next_row
+            index_file.write(json.dumps(["+", list(key), next_row, log_size], ensure_ascii=False) + "\n")
+            next_row += 1
+    return next_row
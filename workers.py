@@ -0,0 +1,61 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Пул потоков для долгих операций (импорт, сохранение, построение индексов,
+# резервное копирование, загрузка), чтобы окно не зависало.
+# Окна Tk из рабочих потоков не трогаются: результаты передаются через очередь,
+# а окно забирает их опросом через after()
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="db-worker")
+
+
+class Cancelled(Exception):
+    pass
+
+
+# Фоновая операция. work(task) выполняется в пуле и сообщает о ходе работы
+# через task.progress(сделано, всего); после отмены progress бросает Cancelled,
+# поэтому операция прерывается в ближайшей точке отчёта.
+# Сообщения в очереди: ("progress", (сделано, всего)), ("done", результат),
+# ("error", исключение), ("cancelled", None)
+class Task:
+    def __init__(self, work):
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.future = executor.submit(self.run, work)
+
+    def run(self, work):
+        try:
+            result = work(self)
+        except Cancelled:
+            self.messages.put(("cancelled", None))
+        except Exception as e:
+            self.messages.put(("error", e))
+        else:
+            # Операцию без точек отчёта нельзя прервать, но её результат после отмены не нужен
+            if self.cancelled():
+                self.messages.put(("cancelled", None))
+            else:
+                self.messages.put(("done", result))
+
+    def progress(self, done, total=None):
+        self.check()
+        self.messages.put(("progress", (done, total)))
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+        if self.cancelled():
+            raise Cancelled("Операция отменена")
+
+    # Накопившиеся сообщения без ожидания
+    def poll(self):
+        while True:
+            try:
+                yield self.messages.get_nowait()
+            except queue.Empty:
+                return